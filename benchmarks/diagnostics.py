@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+# Renders 10k diagnostics in the same file, once by calling write_excerpt()
+# for every diagnostic and once with a single DiagnosticRenderer.
+
+import io
+import random
+import timeit
+
+from sweetener.text import DiagnosticRenderer, TextFile, write_excerpt
+
+def make_text(line_count: int) -> str:
+    rng = random.Random(42)
+    return ''.join('    ' * rng.randrange(4) + 'x' * rng.randrange(1, 80) + '\n' for _ in range(line_count))
+
+def main() -> None:
+
+    line_count = 50000
+    diagnostic_count = 10000
+
+    text = make_text(line_count)
+    file = TextFile(text)
+    rng = random.Random(1)
+    spans = []
+    for _ in range(diagnostic_count):
+        start = rng.randrange(len(text) - 10)
+        spans.append((start, start + rng.randrange(1, 10)))
+
+    def run_write_excerpt_str() -> None:
+        out = io.StringIO()
+        for span in spans:
+            write_excerpt(out, text, span)
+
+    def run_write_excerpt() -> None:
+        out = io.StringIO()
+        for span in spans:
+            write_excerpt(out, file, span)
+
+    def run_renderer() -> None:
+        renderer = DiagnosticRenderer(text)
+        for span in spans:
+            renderer.add(span, 'something went wrong')
+        renderer.write(io.StringIO())
+
+    print(f'lines={line_count} diagnostics={diagnostic_count}')
+    for name, fn, repeat in [
+        # Builds a new TextFile for every diagnostic, which takes long
+        ('write_excerpt(str)', run_write_excerpt_str, 1),
+        ('write_excerpt(TextFile)', run_write_excerpt, 3),
+        ('DiagnosticRenderer', run_renderer, 3),
+    ]:
+        t = min(timeit.repeat(fn, number=1, repeat=repeat))
+        print(f'  {name:<24} {t*1000:10.1f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# Compares Heap and PriorityQueue with the heapq module: bulk construction,
+# push/pop and a Dijkstra-style workload that needs decrease-key. With
+# heapq, decrease-key is emulated by pushing duplicates and skipping stale
+# entries when they are popped.
+
+import heapq
+import random
+import timeit
+
+from sweetener.sorting import Heap, PriorityQueue
+
+def bench(label: str, fn) -> None:
+    elapsed = min(timeit.repeat(fn, number=1, repeat=3))
+    print(f'  {label:<28} {elapsed*1000:10.1f} ms')
+
+def make_graph(n: int, degree: int, seed: int = 42) -> list[list[tuple[int, int]]]:
+    rng = random.Random(seed)
+    return [ [ (rng.randrange(n), rng.randrange(1, 100)) for _ in range(degree) ] for _ in range(n) ]
+
+def dijkstra_heapq(graph, source: int) -> list[float]:
+    dist = [ float('inf') ] * len(graph)
+    dist[source] = 0
+    queue = [ (0, source) ]
+    while queue:
+        d, node = heapq.heappop(queue)
+        if d > dist[node]:
+            continue
+        for target, weight in graph[node]:
+            new_d = d + weight
+            if new_d < dist[target]:
+                dist[target] = new_d
+                heapq.heappush(queue, (new_d, target))
+    return dist
+
+def dijkstra_queue(graph, source: int) -> list[float]:
+    dist = [ float('inf') ] * len(graph)
+    dist[source] = 0
+    queue = PriorityQueue([ (source, 0) ])
+    while queue:
+        node = queue.pop()
+        d = dist[node]
+        for target, weight in graph[node]:
+            new_d = d + weight
+            if new_d < dist[target]:
+                dist[target] = new_d
+                queue.push(target, new_d)
+    return dist
+
+def main() -> None:
+
+    n = 100000
+    rng = random.Random(42)
+    values = rng.sample(range(n * 10), n)
+
+    print(f'n={n}')
+
+    def heapq_build():
+        l = list(values)
+        heapq.heapify(l)
+    bench('heapq.heapify', heapq_build)
+    bench('Heap(values)', lambda: Heap(values))
+
+    def heapq_push_pop():
+        l = []
+        for v in values:
+            heapq.heappush(l, v)
+        while l:
+            heapq.heappop(l)
+    def heap_push_pop():
+        h = Heap[int]()
+        for v in values:
+            h.push(v)
+        while h:
+            h.pop()
+    bench('heapq push/pop', heapq_push_pop)
+    bench('Heap push/pop', heap_push_pop)
+
+    graph = make_graph(20000, 8)
+    assert(dijkstra_heapq(graph, 0) == dijkstra_queue(graph, 0))
+    print('dijkstra, 20000 nodes, 160000 edges')
+    bench('heapq with stale entries', lambda: dijkstra_heapq(graph, 0))
+    bench('PriorityQueue decrease-key', lambda: dijkstra_queue(graph, 0))
+
+if __name__ == '__main__':
+    main()
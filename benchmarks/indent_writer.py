@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+# Measures the throughput of IndentWriter.write() in MB/s, compared to the
+# previous implementation that handled and wrote one character at a time.
+
+import io
+import random
+import re
+import timeit
+
+from sweetener.text import IndentWriter
+
+class CharIndentWriter:
+
+    def __init__(self, out: io.StringIO, indentation='  '):
+        self.output = out
+        self.at_blank_line = True
+        self.newline_count = 0
+        self.indent_level = 0
+        self.indentation = indentation
+        self._re_whitespace = re.compile('[\n\r\t ]')
+
+    def indent(self):
+        self.indent_level += 1
+
+    def dedent(self):
+        self.indent_level -= 1
+
+    def write(self, text: str) -> None:
+        for ch in text:
+            if ch == '\n':
+                self.newline_count = self.newline_count + 1 if self.at_blank_line else 1
+                self.at_blank_line = True
+            elif self.at_blank_line and not self._re_whitespace.match(ch):
+                self.newline_count = 0
+                self.output.write(self.indentation * self.indent_level)
+                self.at_blank_line = False
+            self.output.write(ch)
+
+def make_chunks(count: int) -> list[str]:
+    rng = random.Random(42)
+    chunks = []
+    for _ in range(count):
+        # Mostly single statements, with the occasional larger block
+        if rng.random() < 0.05:
+            chunks.append(''.join(f'x{i} = foo(bar, {i})\n' for i in range(rng.randrange(10, 100))))
+        else:
+            chunks.append('y = ' + 'z' * rng.randrange(60) + '\n')
+    return chunks
+
+def main() -> None:
+
+    chunks = make_chunks(20000)
+    size = sum(len(chunk) for chunk in chunks)
+
+    def run_chunks(cls) -> None:
+        writer = cls(io.StringIO())
+        for i, chunk in enumerate(chunks):
+            if i % 7 == 0:
+                writer.indent()
+            elif i % 7 == 3:
+                writer.dedent()
+            writer.write(chunk)
+
+    text = ''.join(chunks)
+
+    def run_whole(cls) -> None:
+        writer = cls(io.StringIO())
+        writer.indent()
+        writer.write(text)
+
+    print(f'chunks={len(chunks)} chars={size}')
+    for run in [ run_chunks, run_whole ]:
+        print(f'  {run.__name__}')
+        for name, cls in [ ('previous', CharIndentWriter), ('IndentWriter', IndentWriter) ]:
+            t = min(timeit.repeat(lambda: run(cls), number=1, repeat=3))
+            print(f'    {name:<14} {t*1000:10.1f} ms {size / t / 1e6:10.1f} MB/s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+# Resolves random offsets to lines and columns in a large text with
+# LineIndex, compared to the previous implementation that scanned the text
+# one character at a time and searched the line starts linearly.
+
+import random
+import timeit
+
+from sweetener.text import LineIndex
+
+class LinearLineIndex:
+
+    def __init__(self, text: str):
+        self.text = text
+        self.lines = list()
+
+    def _count_lines_until_offset(self, end_offset):
+        end_offset = min(end_offset, len(self.text)-1)
+        line = 1 if not self.lines else len(self.lines)+1
+        offset = 0 if line == 1 else self.lines[line-2]
+        while offset <= end_offset:
+            ch = self.text[offset]
+            offset += 1
+            if ch == '\n':
+                self.lines.append(offset)
+                line += 1
+
+    def get_line(self, offset):
+        if offset == 0:
+            return 1
+        self._count_lines_until_offset(offset)
+        for i, line_start_offset in enumerate(self.lines):
+            if line_start_offset > offset:
+                return i+1
+        return len(self.lines)+1
+
+def make_text(line_count: int) -> str:
+    rng = random.Random(42)
+    return ''.join('    ' * rng.randrange(4) + 'x' * rng.randrange(80) + '\n' for _ in range(line_count))
+
+def main() -> None:
+
+    for line_count, lookups in [ (50000, 1000), (50000, 10000), (1000000, 10000) ]:
+        text = make_text(line_count)
+        rng = random.Random(1)
+        offsets = [ rng.randrange(len(text)) for _ in range(lookups) ]
+        print(f'lines={line_count} chars={len(text)} lookups={lookups}')
+        def run(cls):
+            idx = cls(text)
+            for offset in offsets:
+                idx.get_line(offset)
+        if line_count * lookups <= 50000 * 1000:
+            t = min(timeit.repeat(lambda: run(LinearLineIndex), number=1, repeat=3))
+            print(f'  {"previous":<24} {t*1000:10.1f} ms')
+        t = min(timeit.repeat(lambda: run(LineIndex), number=1, repeat=3))
+        print(f'  {"LineIndex":<24} {t*1000:10.1f} ms')
+        # Diagnostics near the start of a huge file only scan a few chunks
+        t = min(timeit.repeat(lambda: LineIndex(text).get_line(1000), number=1, repeat=3))
+        print(f'  {"first lookup near start":<24} {t*1000:10.3f} ms')
+
+if __name__ == '__main__':
+    main()
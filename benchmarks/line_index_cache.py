@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+# Opens the same large file repeatedly and resolves random offsets, once
+# without a line index cache, once with an empty cache and once with a cache
+# that already has an entry for the file.
+
+import os
+import random
+import tempfile
+import timeit
+
+from sweetener.text import LineIndexCache, TextFile
+
+def make_text(line_count: int) -> str:
+    rng = random.Random(42)
+    return ''.join('    ' * rng.randrange(4) + 'é' * rng.randrange(2) + 'x' * rng.randrange(80) + '\n' for _ in range(line_count))
+
+def main() -> None:
+
+    line_count = 1000000
+    lookups = 1000
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        path = os.path.join(directory, 'input.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(make_text(line_count))
+        cache = LineIndexCache(os.path.join(directory, 'cache'))
+
+        with TextFile.from_path(path) as file:
+            length = len(file.text)
+        rng = random.Random(1)
+        offsets = [ rng.randrange(length) for _ in range(lookups) ]
+        print(f'lines={line_count} bytes={os.path.getsize(path)} lookups={lookups}')
+
+        def run(cache: LineIndexCache | None) -> None:
+            with TextFile.from_path(path, cache=cache) as file:
+                for offset in offsets:
+                    file.get_line(offset)
+                    file.get_column(offset)
+
+        def run_cold() -> None:
+            cache.clear()
+            run(cache)
+
+        for name, fn in [
+            ('no cache', lambda: run(None)),
+            ('cold cache', run_cold),
+            ('warm cache', lambda: run(cache)),
+        ]:
+            t = min(timeit.repeat(fn, number=1, repeat=3))
+            print(f'  {name:<12} {t*1000:10.1f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+# Measures remove() and insert_before() on the elements of a list of nodes.
+# Siblings are relinked in constant time, but the parent paths of the nodes
+# after the edited position are renumbered, so edits at the front of a list
+# grow linearly with its length while edits at the end do not.
+
+import timeit
+
+from sweetener import BaseNode, set_parent_nodes
+
+class Node(BaseNode):
+    pass
+
+class Block(Node):
+    body: list[Node]
+
+class Lit(Node):
+    value: int
+
+def bench(label: str, length: int, index: int) -> None:
+    root = Block([ Lit(i) for i in range(length) ])
+    set_parent_nodes(root)
+    def edit():
+        node = root.body[index]
+        node.remove()
+        root.body[index].insert_before(node)
+    number = max(1, 100000 // length)
+    seconds = min(timeit.repeat(edit, number=number, repeat=3)) / number
+    print(f'{label:<6} length={length:<7} {seconds * 1e6:10.1f} us per remove+insert')
+
+def main() -> None:
+    for length in [ 100, 1000, 10000, 100000 ]:
+        bench('front', length, 0)
+        bench('end', length, length - 2)
+
+if __name__ == '__main__':
+    main()
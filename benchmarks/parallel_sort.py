@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+# Measures how parallel_sort() scales with the amount of worker processes
+# when sorting tokens by a path key, compared to mergesort() and sorted().
+
+import os
+import random
+import sys
+import timeit
+
+from sweetener.sorting import mergesort, parallel_sort
+
+class Position:
+
+    def __init__(self, line: int, column: int) -> None:
+        self.line = line
+        self.column = column
+
+class Token:
+
+    def __init__(self, text: str, pos: Position) -> None:
+        self.text = text
+        self.pos = pos
+
+def bench(label: str, fn, data: list) -> None:
+    elapsed = min(timeit.repeat(lambda: fn(list(data)), number=1, repeat=3))
+    print(f'{label:<28} {elapsed:8.2f} s')
+
+def main() -> None:
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rng = random.Random(42)
+    tokens = [ Token('x', Position(rng.randrange(n), rng.randrange(80))) for _ in range(n) ]
+
+    print(f'n={n} cpus={os.cpu_count()}')
+    bench('sorted(key=lambda)', lambda l: sorted(l, key=lambda t: t.pos.line), tokens)
+    bench('mergesort(key=path)', lambda l: mergesort(l, key='pos.line'), tokens)
+    workers = 1
+    while workers <= max(2, os.cpu_count() or 1):
+        bench(f'parallel_sort(workers={workers})', lambda l: parallel_sort(l, key='pos.line', workers=workers, threshold=0), tokens)
+        workers *= 2
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# Compares compare.eq() on expression trees with the previous recursive
+# implementation, both for plain records and for frozen records that cache
+# their structural hash.
+
+import random
+import timeit
+
+from sweetener import Record, eq
+from sweetener.util import is_primitive
+
+class Expr(Record):
+    pass
+
+class Lit(Expr):
+    value: int
+
+class Add(Expr):
+    left: Expr
+    right: Expr
+
+class Call(Expr):
+    name: str
+    args: list[Expr]
+
+class FrozenExpr(Record, frozen=True):
+    pass
+
+class FrozenLit(FrozenExpr):
+    value: int
+
+class FrozenAdd(FrozenExpr):
+    left: FrozenExpr
+    right: FrozenExpr
+
+class FrozenCall(FrozenExpr):
+    name: str
+    args: list[FrozenExpr]
+
+def eq_recursive(a, b) -> bool:
+    if isinstance(a, Record) and isinstance(b, Record):
+        if a.__class__ != b.__class__:
+            return False
+        for k1, v1 in a.fields.items():
+            if not eq_recursive(b[k1], v1):
+                return False
+        return True
+    elif is_primitive(a) and is_primitive(b):
+        return a == b
+    elif isinstance(a, list) and isinstance(b, list):
+        if len(a) != len(b):
+            return False
+        for el1, el2 in zip(a, b):
+            if not eq_recursive(el1, el2):
+                return False
+        return True
+    return False
+
+def build(lit, add, call, count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    def expr(depth):
+        if depth == 0 or rng.random() < 0.2:
+            return lit(rng.randrange(3))
+        if rng.random() < 0.5:
+            return add(expr(depth-1), expr(depth-1))
+        return call('f', [ expr(depth-1) for _ in range(3) ])
+    return [ expr(6) for _ in range(count) ]
+
+def bench(label: str, fn, xs: list, ys: list) -> None:
+    def run():
+        for x in xs:
+            for y in ys:
+                fn(x, y)
+    elapsed = min(timeit.repeat(run, number=1, repeat=3))
+    print(f'{label:<36} {elapsed*1000:10.1f} ms')
+
+def main() -> None:
+
+    # Every tree of the first list is compared to every tree of the second
+    # list, like a CSE pass that looks up candidates would do
+    count = 60
+
+    xs = build(Lit, Add, Call, count, 1)
+    ys = build(Lit, Add, Call, count, 1)
+    zs = build(Lit, Add, Call, count, 2)
+    bench('plain, recursive eq', eq_recursive, xs, ys + zs)
+    bench('plain, iterative eq', eq, xs, ys + zs)
+
+    xs = build(FrozenLit, FrozenAdd, FrozenCall, count, 1)
+    ys = build(FrozenLit, FrozenAdd, FrozenCall, count, 1)
+    zs = build(FrozenLit, FrozenAdd, FrozenCall, count, 2)
+    bench('frozen, recursive eq', eq_recursive, xs, ys + zs)
+    bench('frozen, iterative eq with hashes', eq, xs, ys + zs)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+# Compares the construction throughput of the generic Record constructor with
+# the generated constructors of compiled records, using the node classes of
+# examples/calc.py.
+
+import timeit
+
+from sweetener import BaseNode
+
+def make_classes(compiled: bool):
+
+    class CalcNode(BaseNode, compiled=compiled):
+        pass
+
+    class Expr(CalcNode):
+        pass
+
+    class Add(Expr):
+        left: Expr
+        right: Expr
+
+    class Sub(Expr):
+        left: Expr
+        right: Expr
+
+    class Var(Expr):
+        name: str
+
+    class Lit(Expr):
+        value: int
+
+    def build():
+        return Sub(
+            Add(
+                Lit(1),
+                Lit(2)
+            ),
+            Var('x')
+        )
+
+    return build
+
+NODES_PER_BUILD = 5
+
+def main() -> None:
+    number = 20000
+    results = {}
+    for name, compiled in [ ('generic', False), ('compiled', True) ]:
+        build = make_classes(compiled)
+        seconds = min(timeit.repeat(build, number=number, repeat=5))
+        results[name] = seconds
+        print(f'{name:>10}: {number * NODES_PER_BUILD / seconds:12.0f} nodes/s')
+    print(f'   speedup: {results["generic"] / results["compiled"]:.2f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+# Builds many small expression trees with lots of repeated subtrees and
+# compares plain records with @interned records in memory use, construction
+# time and compare.eq time.
+
+import gc
+import random
+import timeit
+import tracemalloc
+
+from sweetener import Record, eq, interned
+
+class PlainExpr(Record):
+    pass
+
+class PlainLit(PlainExpr):
+    value: int
+
+class PlainVar(PlainExpr):
+    name: str
+
+class PlainAdd(PlainExpr):
+    left: PlainExpr
+    right: PlainExpr
+
+class InternedExpr(Record):
+    pass
+
+@interned
+class InternedLit(InternedExpr):
+    value: int
+
+@interned
+class InternedVar(InternedExpr):
+    name: str
+
+@interned
+class InternedAdd(InternedExpr):
+    left: InternedExpr
+    right: InternedExpr
+
+def build(add, lit, var, count: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    def expr(depth):
+        if depth == 0 or rng.random() < 0.3:
+            if rng.random() < 0.5:
+                return lit(rng.randrange(4))
+            return var(rng.choice('xyz'))
+        return add(expr(depth-1), expr(depth-1))
+    return [ expr(5) for _ in range(count) ]
+
+def measure_memory(add, lit, var, count: int) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before, _peak = tracemalloc.get_traced_memory()
+    forest = build(add, lit, var, count)
+    after, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del forest
+    return after - before
+
+def main() -> None:
+
+    count = 20000
+
+    for label, (add, lit, var) in [ ('plain', (PlainAdd, PlainLit, PlainVar)), ('interned', (InternedAdd, InternedLit, InternedVar)) ]:
+        memory = measure_memory(add, lit, var, count)
+        construct = min(timeit.repeat(lambda: build(add, lit, var, count), number=1, repeat=3))
+        a = build(add, lit, var, count)
+        b = build(add, lit, var, count)
+        compare = min(timeit.repeat(lambda: all(eq(x, y) for x, y in zip(a, b)), number=1, repeat=3))
+        print(f'{label:<10} memory {memory/1024/1024:7.2f} MiB  build {construct*1000:8.1f} ms  eq {compare*1000:8.1f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+# Measures how many bytes each node of an expression tree takes when its
+# fields are stored in a __dict__ compared to when the record is @slotted.
+
+import gc
+import tracemalloc
+
+from sweetener import BaseNode, slotted
+
+class DictNode(BaseNode):
+    pass
+
+class DictAdd(DictNode):
+    left: DictNode
+    right: DictNode
+
+class DictLit(DictNode):
+    value: int
+
+@slotted
+class SlotNode(BaseNode):
+    pass
+
+@slotted
+class SlotAdd(SlotNode):
+    left: SlotNode
+    right: SlotNode
+
+@slotted
+class SlotLit(SlotNode):
+    value: int
+
+def build(add, lit, count: int):
+    # A left-leaning chain of additions with `count` literals
+    node = lit(0)
+    for i in range(1, count):
+        node = add(node, lit(i))
+    return node
+
+def measure(add, lit, count: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before, _peak = tracemalloc.get_traced_memory()
+    tree = build(add, lit, count)
+    after, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del tree
+    return (after - before) / (2 * count - 1)
+
+def main() -> None:
+    count = 50000
+    dict_bytes = measure(DictAdd, DictLit, count)
+    slot_bytes = measure(SlotAdd, SlotLit, count)
+    print(f'    dict: {dict_bytes:8.1f} bytes/node')
+    print(f' slotted: {slot_bytes:8.1f} bytes/node')
+    print(f'   saved: {100 * (1 - slot_bytes / dict_bytes):8.1f} %')
+
+if __name__ == '__main__':
+    main()
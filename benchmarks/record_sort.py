@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+# Sorts records through Record.__lt__ and through precomputed sort keys.
+
+import random
+import timeit
+
+from sweetener import Record, sort_key
+
+class Symbol(Record):
+    name: str
+    scope: list[str]
+    attrs: dict[str, int]
+
+class FrozenSymbol(Record, frozen=True):
+    name: str
+    scope: tuple[str, ...]
+    line: int
+
+def main() -> None:
+
+    rng = random.Random(42)
+    words = [ 'foo', 'bar', 'baz', 'qux', 'quux' ]
+
+    for count in [ 1000, 10000, 100000 ]:
+        symbols = [
+            Symbol(rng.choice(words), [ rng.choice(words) for _ in range(3) ], { rng.choice(words): rng.randrange(10) })
+            for _ in range(count)
+        ]
+        frozen = [ FrozenSymbol(s.name, tuple(s.scope), rng.randrange(1000)) for s in symbols ]
+        print(f'count={count}')
+        if count <= 10000:
+            t = min(timeit.repeat(lambda: sorted(symbols), number=1, repeat=3))
+            print(f'  {"sorted(records)":<36} {t*1000:10.1f} ms')
+        t = min(timeit.repeat(lambda: sorted(symbols, key=sort_key), number=1, repeat=3))
+        print(f'  {"sorted(records, key=sort_key)":<36} {t*1000:10.1f} ms')
+        sorted(frozen, key=sort_key)
+        t = min(timeit.repeat(lambda: sorted(frozen, key=sort_key), number=1, repeat=3))
+        print(f'  {"frozen records, cached keys":<36} {t*1000:10.1f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# Compares the explicit-stack set_parent_nodes() with the previous recursive
+# implementation that built a fresh path list for every visited value.
+
+import random
+import sys
+import timeit
+
+from sweetener import BaseNode, set_parent_nodes, preorder, preorder_with_paths
+from sweetener.node import expand_no_basenode
+
+class Node(BaseNode):
+    pass
+
+class Block(Node):
+    body: list[Node]
+
+class Add(Node):
+    left: Node
+    right: Node
+
+class Lit(Node):
+    value: int
+
+def set_parent_nodes_recursive(node, parent=None, path=[]):
+    node.parent = parent
+    node.parent_path = path
+    prev = None
+    for field_name, field_value in node.fields.items():
+        for new_path, child in preorder_with_paths(field_value, expand=expand_no_basenode):
+            if isinstance(child, BaseNode):
+                new_path.insert(0, field_name)
+                set_parent_nodes_recursive(child, node, new_path)
+                child._prev_sibling = prev
+                if prev is None:
+                    node._first_child = child
+                else:
+                    prev._next_sibling = child
+                prev = child
+    if prev is None:
+        node._first_child = None
+    else:
+        prev._next_sibling = None
+    node._last_child = prev
+
+def make_wide_tree(count: int) -> Node:
+    rng = random.Random(42)
+    def expr(depth):
+        if depth == 0 or rng.random() < 0.3:
+            return Lit(rng.randrange(100))
+        return Add(expr(depth-1), expr(depth-1))
+    return Block([ expr(6) for _ in range(count) ])
+
+def make_deep_tree(depth: int) -> Node:
+    node = Lit(0)
+    for i in range(depth):
+        node = Add(node, Lit(i))
+    return node
+
+def count_nodes(root: Node) -> int:
+    return sum(1 for value in preorder(root) if isinstance(value, BaseNode))
+
+def main() -> None:
+    root = make_wide_tree(2000)
+    n = count_nodes(root)
+    for name, proc in [ ('recursive', set_parent_nodes_recursive), ('iterative', set_parent_nodes) ]:
+        seconds = min(timeit.repeat(lambda: proc(root), number=5, repeat=3)) / 5
+        print(f'{name:>10}: {seconds * 1000:8.1f} ms for {n} nodes ({n / seconds:10.0f} nodes/s)')
+    depth = sys.getrecursionlimit() * 4
+    deep = make_deep_tree(depth)
+    try:
+        set_parent_nodes_recursive(deep)
+        print(f'recursive version handled a chain of depth {depth}')
+    except RecursionError:
+        print(f'recursive version failed on a chain of depth {depth}')
+    set_parent_nodes(deep)
+    print(f'iterative version handled a chain of depth {depth}')
+
+if __name__ == '__main__':
+    main()
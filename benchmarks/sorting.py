@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# Compares the sorting algorithms in sweetener.sorting with each other and
+# with the built-in sorted() on several kinds of input.
+
+import operator
+import random
+import sys
+import timeit
+
+from sweetener.common import lift
+from sweetener.sorting import cmp_to_key, heapsort, mergesort, quicksort
+
+class Token:
+
+    def __init__(self, line: int, column: int) -> None:
+        self.line = line
+        self.column = column
+
+def make_inputs(n: int) -> dict[str, list[int]]:
+    rng = random.Random(42)
+    return {
+        'random': [ rng.randrange(n * 10) for _ in range(n) ],
+        'sorted': list(range(n)),
+        'reversed': list(reversed(range(n))),
+        'duplicates': [ rng.randrange(10) for _ in range(n) ],
+    }
+
+def bench(fn, data: list) -> str:
+    try:
+        elapsed = min(timeit.repeat(lambda: fn(list(data)), number=1, repeat=3))
+    except RecursionError:
+        return 'recursion'
+    return f'{elapsed*1000:.1f} ms'
+
+def main() -> None:
+
+    n = 20000
+    algorithms = [
+        ('sorted', sorted),
+        ('mergesort', mergesort),
+        ('heapsort', heapsort),
+        ('quicksort', quicksort),
+    ]
+
+    print(f'n={n}')
+    print(f'{"":<12}' + ''.join(f'{name:>14}' for name, _fn in algorithms))
+    for kind, data in make_inputs(n).items():
+        print(f'{kind:<12}' + ''.join(f'{bench(fn, data):>14}' for _name, fn in algorithms))
+    print()
+
+    # Sorting by a path. Each key is resolved once and the positions are
+    # sorted, instead of resolving the path twice for every comparison with
+    # a lifted comparison function.
+    rng = random.Random(42)
+    tokens = [ { 'pos': Token(rng.randrange(1000), rng.randrange(80)) } for _ in range(n) ]
+    lifted = lift(operator.lt, 'pos.line')
+    print(f'key=\'pos.line\'')
+    print(f'{"":<12}{"lift(cmp)":>14}{"keys":>14}')
+    print(f'{"sorted":<12}{"":>14}{bench(lambda l: sorted(l, key=lambda t: t["pos"].line), tokens):>14}')
+    for name, fn in algorithms[1:]:
+        print(f'{name:<12}{bench(lambda l: fn(l, cmp=lifted), tokens):>14}{bench(lambda l: fn(l, key="pos.line"), tokens):>14}')
+    print()
+
+    # A custom comparison function, used directly and through cmp_to_key()
+    by_column = lambda a, b: (a.line, a.column) < (b.line, b.column)
+    positions = [ token['pos'] for token in tokens ]
+    print('cmp=by_column')
+    print(f'{"sorted":<12}{"":>14}{bench(lambda l: sorted(l, key=cmp_to_key(by_column)), positions):>14}')
+    print(f'{"mergesort":<12}{bench(lambda l: mergesort(l, cmp=by_column), positions):>14}{bench(lambda l: mergesort(l, key=cmp_to_key(by_column)), positions):>14}')
+
+if __name__ == '__main__':
+    sys.setrecursionlimit(10000)
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+# Rewrites a synthetic AST with transform() in both change-detection modes
+# and compares against the previous recursive implementation.
+
+import sys
+import timeit
+
+from sweetener import Record, transform
+from sweetener.util import primitive_types
+
+class Expr(Record):
+    pass
+
+class Lit(Expr):
+    value: int
+
+class Var(Expr):
+    name: str
+
+class Call(Expr):
+    fn: Expr
+    args: list[list[Expr]]
+
+class Let(Expr):
+    name: str
+    value: Expr
+    body: Expr
+
+def transform_recursive(value, proc):
+    new_value = proc(value)
+    if new_value != value:
+        return new_value
+    for cls in primitive_types:
+        if isinstance(value, cls):
+            return value
+    if isinstance(value, (list, tuple)):
+        new_elements = []
+        has_new_element = False
+        for element in value:
+            new_element = transform_recursive(element, proc)
+            if new_element != element:
+                has_new_element = True
+            new_elements.append(new_element)
+        if not has_new_element:
+            return value
+        return new_elements if isinstance(value, list) else tuple(new_elements)
+    if isinstance(value, Record):
+        new_fields = {}
+        has_new_field = False
+        for key, field in value.fields.items():
+            new_field = transform_recursive(field, proc)
+            if new_field != field:
+                has_new_field = True
+            new_fields[key] = new_field
+        return value.__class__(**new_fields) if has_new_field else value
+    raise RuntimeError(f'unexpected {value}')
+
+def make_tree(depth: int, width: int) -> Expr:
+    """
+    Build a chain of `depth` nested let-expressions, each of which binds a
+    call with `width` groups of arguments.
+    """
+    node: Expr = Var('x')
+    for i in range(depth):
+        args = [ [ Lit(i), Var(f'v{j}') ] for j in range(width) ]
+        node = Let(f'v{i}', Call(Var('f'), args), node)
+    return node
+
+def make_cons_list(length: int) -> tuple:
+    """
+    Build a cons-list of plain tuples, which `!=` compares structurally.
+    """
+    node: tuple = (Var('x'),)
+    for i in range(length):
+        node = (Lit(i), node)
+    return node
+
+def rename(value):
+    if isinstance(value, Var) and value.name == 'x':
+        return Var('y')
+    return value
+
+def count_nodes(node) -> int:
+    count = 0
+    stack = [ node ]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, Record):
+            count += 1
+            stack.extend(v for _k, v in value.fields.items())
+        elif isinstance(value, list):
+            stack.extend(value)
+        elif isinstance(value, tuple):
+            count += 1
+            stack.extend(value)
+    return count
+
+def bench(label: str, fn, tree, nodes: int) -> None:
+    elapsed = min(timeit.repeat(lambda: fn(tree), number=1, repeat=5))
+    print(f'{label:<28} {elapsed*1000:10.1f} ms {nodes/elapsed:14,.0f} nodes/s')
+
+def main() -> None:
+
+    for depth, width in [ (100, 20), (5000, 20), (50000, 1) ]:
+        tree = make_tree(depth, width)
+        nodes = count_nodes(tree)
+        print(f'let-chain depth={depth} width={width} nodes={nodes}')
+        bench('transform(identity=False)', lambda t: transform(t, rename), tree, nodes)
+        bench('transform(identity=True)', lambda t: transform(t, rename, identity=True), tree, nodes)
+        if depth * 5 < sys.getrecursionlimit():
+            bench('recursive', lambda t: transform_recursive(t, rename), tree, nodes)
+        else:
+            print(f'{"recursive":<28} {"exceeds recursion limit":>13}')
+        print()
+
+    # Comparing a rebuilt tuple with the original one descends all the way
+    # down to the changed element, so this is quadratic with `!=`
+    for length in [ 250, 500, 1000 ]:
+        cons = make_cons_list(length)
+        nodes = count_nodes(cons)
+        print(f'cons-list length={length} nodes={nodes}')
+        bench('transform(identity=False)', lambda t: transform(t, rename), cons, nodes)
+        bench('transform(identity=True)', lambda t: transform(t, rename, identity=True), cons, nodes)
+        print()
+
+if __name__ == '__main__':
+    main()
@@ -4,5 +4,6 @@ from .node import *
 from .compare import *
 from .text import *
 from .sorting import *
+from .visitor import *
 from .plot import visualize, Plottable
 
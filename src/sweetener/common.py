@@ -24,11 +24,11 @@ def get(value: Any, path: PathLike):
         if isinstance(value, tuple) or isinstance(value, list):
             assert(isinstance(chunk, int))
             value = value[chunk]
+        elif isinstance(value, dict):
+            value = value[chunk]
         elif isinstance(value, object):
             assert(isinstance(chunk, str))
             value = getattr(value, chunk)
-        elif isinstance(value, dict):
-            value = value[chunk]
         else:
             raise NotImplementedError(f"did not know how to get {chunk} from {value}")
     return value
@@ -1,7 +1,8 @@
 
-from typing import Protocol, Self, TypeVar
+from typing import Any, Protocol, Self, TypeVar
 
 from .constants import EQUAL_METHOD_NAME
+from .record import _HASH_ATTR_NAME, Record, get_schema, is_frozen, structural_hash
 from .util import get_type_index, hasmethod, is_primitive
 
 class _Comparable(Protocol):
@@ -19,39 +20,77 @@ def lt(v1: _Comparable, v2: _Comparable) -> bool:
         return v1 < v2
     return False
 
+def _get_hash(value: Record) -> int | None:
+    h = getattr(value, _HASH_ATTR_NAME, None)
+    if h is None and is_frozen(value):
+        h = structural_hash(value)
+    return h
+
 def eq(a: _T, b: _T) -> bool:
-    if hasmethod(a, EQUAL_METHOD_NAME) and hasmethod(b, EQUAL_METHOD_NAME):
-        equal_a_b = getattr(a, EQUAL_METHOD_NAME)
-        equal_b_a = getattr(b, EQUAL_METHOD_NAME)
-        try:
-            return equal_a_b(b)
-        except TypeError:
-            return equal_b_a(a)
-    elif is_primitive(a) and is_primitive(b):
-        return a == b
-    elif isinstance(a, list) and isinstance(b, list):
-        if len(a) != len(b):
-            return False
-        for el1, el2 in zip(a, b):
-            if not eq(el1, el2):
+    """
+    Check whether `a` and `b` are structurally equal.
+
+    Records are equal when they are of the same class and their fields are
+    equal. Lists, tuples and dictionaries are compared element by element.
+    Values that are the same object are not looked into, and two frozen
+    records with a different structural hash are unequal without comparing
+    their fields.
+    """
+    stack: list[tuple[Any, Any]] = [ (a, b) ]
+    while stack:
+        a, b = stack.pop()
+        if a is b:
+            continue
+        if isinstance(a, Record) and isinstance(b, Record):
+            cls = type(a)
+            if cls is not type(b):
                 return False
-        return True
-    elif isinstance(a, tuple) and isinstance(b, tuple):
-        if len(a) != len(b):
-            return False
-        for el1, el2 in zip(a, b):
-            if not eq(el1, el2):
+            if cls._equal is not Record._equal:
+                # A subclass knows better how to compare its instances
+                if not a._equal(b):
+                    return False
+                continue
+            h1 = _get_hash(a)
+            if h1 is not None:
+                h2 = _get_hash(b)
+                if h2 is not None and h1 != h2:
+                    return False
+            get_fields = get_schema(cls).get_fields
+            fields_a = get_fields(a)
+            fields_b = get_fields(b)
+            for i in reversed(range(len(fields_a))):
+                stack.append((fields_a[i][1], fields_b[i][1]))
+        elif hasmethod(a, EQUAL_METHOD_NAME) and hasmethod(b, EQUAL_METHOD_NAME):
+            equal_a_b = getattr(a, EQUAL_METHOD_NAME)
+            equal_b_a = getattr(b, EQUAL_METHOD_NAME)
+            try:
+                if not equal_a_b(b):
+                    return False
+            except TypeError:
+                if not equal_b_a(a):
+                    return False
+        elif is_primitive(a) and is_primitive(b):
+            if a != b:
                 return False
-        return True
-    elif isinstance(a, dict) and isinstance(b, dict):
-        if len(a) != len(b):
-            return False
-        for (k_1, v_1), (k_2, v_2) in zip(a.items(), b.items()):
-            if not eq(k_1, k_2) or not eq(v_1, v_2):
+        elif (isinstance(a, list) and isinstance(b, list)) \
+                or (isinstance(a, tuple) and isinstance(b, tuple)):
+            if len(a) != len(b):
                 return False
-        return True
-    else:
-        return False
+            for i in reversed(range(len(a))):
+                stack.append((a[i], b[i]))
+        elif isinstance(a, dict) and isinstance(b, dict):
+            if len(a) != len(b):
+                return False
+            items_a = list(a.items())
+            items_b = list(b.items())
+            for i in reversed(range(len(items_a))):
+                k_1, v_1 = items_a[i]
+                k_2, v_2 = items_b[i]
+                stack.append((v_1, v_2))
+                stack.append((k_1, k_2))
+        else:
+            return False
+    return True
 
 def le(v1: _Comparable, v2: _Comparable) -> bool:
     return lt(v1, v2) or eq(v1, v2)
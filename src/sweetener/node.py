@@ -1,9 +1,9 @@
 
 from collections import deque
-from typing import Any, Generator, Iterable, Literal
+from typing import Any, Generator, Iterable, Literal, Self, Sequence
 
-from .util import first, last
-from .record import Record
+from .util import first, is_primitive, last
+from .record import Record, get_schema
 from .ops import ExpandFn, expand, increment_key, decrement_key, resolve, erase
 
 type Key = str | int
@@ -17,8 +17,8 @@ def breadthfirst(root: Any, expand: ExpandFn = expand) -> Iterable[Any]:
     while len(queue) > 0:
         node = queue.popleft()
         yield node
-        for node in reversed(list(expand(node))):
-            queue.append(node)
+        for _key, value in expand(node):
+            queue.append(value)
 
 def preorder(root: Any, expand=expand) -> Iterable[Any]:
     stack = [ root ]
@@ -33,7 +33,7 @@ def preorder_with_paths(root: Any, expand: ExpandFn = expand) -> Iterable[Any]:
     while stack:
         path, node = stack.pop()
         yield path, node
-        for (key, value) in expand(node):
+        for (key, value) in reversed(list(expand(node))):
             stack.append((path + [ key ], value))
 
 def postorder(root: Any, expand: ExpandFn = expand) -> Iterable[Any]:
@@ -42,19 +42,30 @@ def postorder(root: Any, expand: ExpandFn = expand) -> Iterable[Any]:
     while stack_1:
         node = stack_1.pop()
         stack_2.append(node)
-        for child in reversed(list(expand(node))):
-            stack_1.append(child)
+        for _key, value in expand(node):
+            stack_1.append(value)
     for node in reversed(stack_2):
         yield node
 
 class BaseNode(Record):
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.parent: BaseNode | None = None
-        self.parent_path: Path | None = None
-        self._prev_sibling: BaseNode | None | Unassigned = False
-        self._next_sibling: BaseNode | None | Unassigned = False
+    __slots__ = ('parent', 'parent_path', '_prev_sibling', '_next_sibling', '_first_child', '_last_child')
+
+    def __post_init__(self) -> None:
+        # The bookkeeping attributes are not fields, so the type checks in
+        # Record.__setattr__ can be skipped
+        self.parent: 'BaseNode | None'
+        self.parent_path: 'Path | None'
+        set_attr = object.__setattr__
+        set_attr(self, 'parent', None)
+        set_attr(self, 'parent_path', None)
+        # The direct child nodes of a parent form a doubly-linked list that
+        # is built by `set_parent_nodes()` and kept up to date by `remove()`,
+        # `replace_with()`, `insert_before()` and `insert_after()`.
+        set_attr(self, '_prev_sibling', False)
+        set_attr(self, '_next_sibling', False)
+        set_attr(self, '_first_child', False)
+        set_attr(self, '_last_child', False)
 
     def get_full_path(self):
         path = []
@@ -70,8 +81,10 @@ class BaseNode(Record):
 
     @property
     def prev_sibling(self) -> 'BaseNode | None':
-        if self._prev_sibling != False:
+        if self._prev_sibling is not False:
             return self._prev_sibling
+        if self.parent is None:
+            return None
         path = self.parent_path
         while True:
             path = decrement_key(self.parent, path, expand=expand_no_basenode)
@@ -85,13 +98,15 @@ class BaseNode(Record):
                 #     node = node.last_child
                 break
         self._prev_sibling = node
-        if node is not None:
+        # Nodes that are shared with another tree by `update_in()` belong to
+        # a different parent, so their own links must be left alone
+        if node is not None and node.parent is self.parent:
             node._next_sibling = self
         return node
 
     @property
     def next_sibling(self) -> 'BaseNode | None':
-        if self._next_sibling != False:
+        if self._next_sibling is not False:
             return self._next_sibling
         node = self.parent
         path = self.parent_path
@@ -109,11 +124,38 @@ class BaseNode(Record):
                     node = value
                     break
         self._next_sibling = node
-        if node is not None:
+        if node is not None and node.parent is self.parent:
             node._prev_sibling = self
         return node
 
+    def _link_siblings(self, prev: 'BaseNode | None', next: 'BaseNode | None') -> None:
+        # Put `self` in between `prev` and `next` in the sibling list of its parent
+        parent = self.parent
+        self._prev_sibling = prev
+        self._next_sibling = next
+        if prev is not None:
+            prev._next_sibling = self
+        elif parent is not None and parent._first_child is not False:
+            parent._first_child = self
+        if next is not None:
+            next._prev_sibling = self
+        elif parent is not None and parent._last_child is not False:
+            parent._last_child = self
+
+    def _detach(self) -> None:
+        self.parent = None
+        self.parent_path = None
+        self._prev_sibling = None
+        self._next_sibling = None
+
     def remove(self) -> None:
+        """
+        Remove this node from its parent.
+
+        The siblings are relinked in O(1) time, but if this node is an element
+        of a list, the parent paths of the k nodes after it are renumbered,
+        which takes O(k) time.
+        """
 
         if self.parent is None:
             # Assuming this structure is the root, in which case we can't remove it
@@ -122,87 +164,260 @@ class BaseNode(Record):
         # If parent is set `parent_path` MUST also be set
         assert(self.parent_path is not None)
 
-        def update_paths(value: Any, k: int) -> None:
-            match value:
-                case BaseNode():
-                    if value.parent_path is not None:
-                        value.parent_path[k] -= 1 # type: ignore
-                case dict():
-                    for field_value in value.values():
-                        update_paths(field_value, k)
-                case list() | tuple():
-                    for i in range(0, len(value)):
-                        update_paths(value, k)
+        # Find the siblings before the tree changes
+        prev = self.prev_sibling
+        next = self.next_sibling
 
         # Get the structure that is directly holding `self`
-        parent = resolve(self.parent, self.parent_path[:-1])
+        parent = self.parent
+        container = resolve(parent, self.parent_path[:-1])
+        key = self.parent_path[-1]
 
-        if isinstance(parent, list):
-            key = self.parent_path[-1]
+        if isinstance(container, list):
             assert(isinstance(key, int))
-            # Take the index after the removed element
-            key += 1
-            for i in range(key, len(parent)):
-                element = parent[i]
-                update_paths(element, len(self.parent_path)-1)
+            # Every element after the removed element moves one position down
+            _shift_paths(parent, container, key+1, len(self.parent_path)-1, -1)
 
         # Remove `self` from the parent structure
-        key = self.parent_path[-1]
-        erase(parent, key)
+        erase(container, key)
 
-        # Update the sibling pointers only when they're already pointing to a node
-        # If they're pointing to None, no action needs to be taken
-        if self._prev_sibling:
-            self._prev_sibling._next_sibling = self.next_sibling
-        if self._next_sibling:
-            self._next_sibling._prev_sibling = self.prev_sibling
+        if prev is not None:
+            prev._next_sibling = next
+        elif parent._first_child is not False:
+            parent._first_child = next
+        if next is not None:
+            next._prev_sibling = prev
+        elif parent._last_child is not False:
+            parent._last_child = prev
+
+        self._detach()
 
     def replace_with(self, new_node: 'BaseNode') -> None:
-        new_node.parent = self.parent
-        new_node.parent_path = self.parent_path
-        if self._prev_sibling:
-            self._prev_sibling._next_sibling = new_node
-        if self._next_sibling:
-            self._next_sibling._prev_sibling = new_node
-        if self.parent is not None:
-            for field_name, field_value in self.parent.fields.items():
-                for path, child in preorder_with_paths(field_value, expand=expand_no_basenode):
-                    if child == self:
-                        path.insert(0, field_name)
-                        value = resolve(self.parent, path[:-1])
-                        value[path[-1]] = new_node
+        """
+        Put `new_node` in the place of this node.
+
+        No other node has to move, but `new_node` is indexed with
+        `set_parent_nodes()`, so this takes time linear in the size of
+        `new_node`.
+        """
+        parent = self.parent
+        path = self.parent_path
+        prev = self._prev_sibling
+        next = self._next_sibling
+        if parent is not None:
+            assert(path is not None)
+            container = resolve(parent, path[:-1])
+            container[path[-1]] = new_node
+            set_parent_nodes(new_node, parent, path)
+            if prev is not False and next is not False:
+                new_node._link_siblings(prev, next)
+            else:
+                new_node._prev_sibling = prev
+                new_node._next_sibling = next
+                if isinstance(prev, BaseNode):
+                    prev._next_sibling = new_node
+                if isinstance(next, BaseNode):
+                    next._prev_sibling = new_node
+                if parent._first_child is self:
+                    parent._first_child = new_node
+                if parent._last_child is self:
+                    parent._last_child = new_node
+        else:
+            new_node.parent = None
+            new_node.parent_path = path
+        self._detach()
+
+    def _insert_sibling(self, new_node: 'BaseNode', offset: int) -> None:
+        parent = self.parent
+        path = self.parent_path
+        if parent is None:
+            raise RuntimeError(f'cannot insert a sibling next to a node that has no parent')
+        assert(path is not None)
+        container = resolve(parent, path[:-1])
+        key = path[-1]
+        if not isinstance(container, list):
+            raise RuntimeError(f'cannot insert a sibling next to a node that is not an element of a list')
+        assert(isinstance(key, int))
+        # Find the siblings before the tree changes
+        if offset == 0:
+            prev = self.prev_sibling
+            next = self
+        else:
+            prev = self
+            next = self.next_sibling
+        index = key + offset
+        _shift_paths(parent, container, index, len(path)-1, 1)
+        container.insert(index, new_node)
+        set_parent_nodes(new_node, parent, path[:-1] + [ index ])
+        new_node._link_siblings(prev, next)
+
+    def insert_before(self, new_node: 'BaseNode') -> None:
+        """
+        Insert `new_node` right before this node in the list that holds this node.
+
+        Like `remove()`, this renumbers the parent paths of the nodes that
+        come after it in the list.
+        """
+        self._insert_sibling(new_node, 0)
+
+    def insert_after(self, new_node: 'BaseNode') -> None:
+        """
+        Insert `new_node` right after this node in the list that holds this node.
+
+        Like `remove()`, this renumbers the parent paths of the nodes that
+        come after it in the list.
+        """
+        self._insert_sibling(new_node, 1)
+
+    def update_in(self, path: Sequence[Any], new_value: Any) -> Self:
+        """
+        Return a copy of this node where the value at `path` is replaced with
+        `new_value`.
+
+        The nodes that are copied along `path` point to their new parents and
+        `new_value` is attached to the new tree. The nodes that are shared
+        with the old tree keep pointing to their old parents. Call
+        `set_parent_nodes()` on the result to move all nodes over to the new
+        tree.
+        """
+        new_root = super().update_in(path, new_value)
+        if new_root is self or not path:
+            return new_root
+        set_attr = object.__setattr__
+        set_attr(new_root, 'parent_path', [])
+        parent = new_root
+        start = 0
+        value = new_root
+        for i in range(len(path) - 1):
+            value = resolve(value, path[i])
+            if isinstance(value, BaseNode):
+                set_attr(value, 'parent', parent)
+                set_attr(value, 'parent_path', list(path[start:i+1]))
+                parent = value
+                start = i + 1
+        if isinstance(new_value, BaseNode):
+            # The siblings of `new_value` in its old tree are not its siblings
+            # in the new tree
+            set_attr(new_value, '_prev_sibling', False)
+            set_attr(new_value, '_next_sibling', False)
+            set_parent_nodes(new_value, parent, list(path[start:]))
+        return new_root
 
     @property
     def first_child(self) -> 'BaseNode | None':
+        if self._first_child is not False:
+            return self._first_child
         return first(self.get_child_nodes())
 
     @property
     def last_child(self) -> 'BaseNode | None':
+        if self._last_child is not False:
+            return self._last_child
         return last(self.get_child_nodes())
 
     def get_all_child_nodes(self) -> Generator['BaseNode', None, None]:
-        for field_value in self.fields.values():
-            for child in preorder(field_value):
+        for _field_name, field_value in get_schema(type(self)).get_child_fields(self):
+            for child in preorder(field_value, expand=expand_nodes):
                 if isinstance(child, BaseNode):
                     yield child
 
     def get_child_nodes(self) -> Generator['BaseNode', None, None]:
-        for field_value in self.fields.values():
+        for _field_name, field_value in get_schema(type(self)).get_child_fields(self):
             for child in preorder(field_value, expand=expand_no_basenode):
                 if isinstance(child, BaseNode):
                     yield child
 
 
-def expand_no_basenode(value):
-    if not isinstance(value, BaseNode):
-        yield from expand(value)
+def expand_nodes(value: Any) -> Iterable[tuple[Any, Any]]:
+    """
+    Like `expand()`, but skips the fields of records that according to their
+    annotations can't hold other records, such as `int` or `str` fields.
+    """
+    if isinstance(value, Record):
+        return iter(get_schema(type(value)).get_child_fields(value))
+    if is_primitive(value):
+        return iter(())
+    return expand(value)
+
+def expand_no_basenode(value: Any) -> Iterable[tuple[Any, Any]]:
+    if isinstance(value, BaseNode):
+        return iter(())
+    return expand_nodes(value)
+
+def _shift_paths(parent: BaseNode, elements: list[Any], start: int, depth: int, delta: int) -> None:
+    # The nodes in `elements` starting at `start` are about to move `delta`
+    # positions, so the key at `depth` in their parent path has to change.
+    # Skips Record.__setattr__, as in set_parent_nodes()
+    set_attr = object.__setattr__
+    for i in range(start, len(elements)):
+        element = elements[i]
+        # Most lists hold the nodes themselves, which need no traversal
+        children = (element,) if isinstance(element, BaseNode) else preorder(element, expand=expand_no_basenode)
+        for child in children:
+            if isinstance(child, BaseNode) and child.parent is parent:
+                path = child.parent_path
+                assert(path is not None)
+                set_attr(child, 'parent_path', path[:depth] + [ path[depth] + delta ] + path[depth+1:]) # type: ignore
+
+def _get_child_nodes_with_paths(node: BaseNode) -> Iterable[tuple[Path, BaseNode]]:
+    """
+    Generate the direct child nodes of `node` in order together with their
+    path relative to `node`.
+
+    Only the paths of the nodes that are found are allocated. While
+    descending into lists, tuples and dictionaries, a single stack of keys is
+    shared.
+    """
+    keys = []
+    for field_name, field_value in get_schema(type(node)).get_child_fields(node):
+        if isinstance(field_value, BaseNode):
+            yield [ field_name ], field_value
+            continue
+        if is_primitive(field_value):
+            continue
+        keys.append(field_name)
+        iterators = [ iter(expand_nodes(field_value)) ]
+        while iterators:
+            try:
+                key, value = next(iterators[-1])
+            except StopIteration:
+                iterators.pop()
+                keys.pop()
+                continue
+            if isinstance(value, BaseNode):
+                keys.append(key)
+                yield list(keys), value
+                keys.pop()
+            elif not is_primitive(value):
+                keys.append(key)
+                iterators.append(iter(expand_nodes(value)))
 
 def set_parent_nodes(node: BaseNode, parent: BaseNode | None = None, path: Path = []) -> None:
+    """
+    Assign `parent` and `parent_path` of every node in the tree rooted at
+    `node` and index the siblings of each node.
+    """
     node.parent = parent
     node.parent_path = path
-    for field_name, field_value in node.fields.items():
-        for new_path, child in preorder_with_paths(field_value, expand=expand_no_basenode):
-            if isinstance(child, BaseNode):
-                new_path.insert(0, field_name)
-                set_parent_nodes(child, node, new_path)
-
+    # The bookkeeping attributes are not fields, so the type checks in
+    # Record.__setattr__ can be skipped
+    set_attr = object.__setattr__
+    stack = [ node ]
+    while stack:
+        parent = stack.pop()
+        prev = None
+        for child_path, child in _get_child_nodes_with_paths(parent):
+            set_attr(child, 'parent', parent)
+            set_attr(child, 'parent_path', child_path)
+            set_attr(child, '_prev_sibling', prev)
+            if prev is None:
+                set_attr(parent, '_first_child', child)
+            else:
+                set_attr(prev, '_next_sibling', child)
+            prev = child
+            stack.append(child)
+        if prev is None:
+            set_attr(parent, '_first_child', None)
+        else:
+            set_attr(prev, '_next_sibling', None)
+        set_attr(parent, '_last_child', prev)
@@ -34,10 +34,10 @@ def expand(value: Any) -> Iterable[tuple[Any, Any]]:
             yield i, value[i]
     elif isinstance(value, dict):
         yield from value.items()
-    elif hasmethod(value, '_expand'):
-        yield from value._expand()
     else:
-        pass
+        method = getattr(value, '_expand', None)
+        if method is not None:
+            yield from method()
 
 @overload
 def resolve(value: Sequence[_T], key: int) -> _T: ...
@@ -1,72 +1,20 @@
 
+import collections.abc
+from enum import IntEnum
+from functools import partial
+import types
 import typing
 import inspect
-from typing import Any, Iterable, Self, TypeVar, cast
+import weakref
+from typing import Any, Callable, Iterable, Self, Sequence, TypeVar, cast
 
-from sweetener.typing import CoercionError, add_coercion, coerce, satisfies_type
+from sweetener.typing import CoercionError, TypeCheckFn, add_coercion, coerce, compile_type_check, satisfies_type
 
-from .ops import clone
+from .ops import clone, resolve
 from .util import get_class_name, get_type_index, pretty_enumerate, reflect, primitive_types
 
 _T = TypeVar('_T')
 
-def _lt_helper_dict(a, b):
-    keys_a = list(a.keys())
-    keys_a.sort()
-    keys_b = list(b.keys())
-    keys_b.sort()
-    i1 = 0
-    i2 = 0
-    is_equal = True
-    while True:
-        if i1 == len(keys_a) or i2 == len(keys_b):
-            break
-        k1 = keys_a[i1]
-        k2 = keys_b[i2]
-        if _lt_helper(k1, k2):
-            is_equal = False
-            i1 += 1
-        elif is_equal and _lt_helper(k2, k1):
-           return False
-        else:
-            v1 = a[k1]
-            v2 = b[k2]
-            if _lt_helper(v1, v2):
-                is_equal = False
-            elif is_equal and _lt_helper(v2, v1):
-                return False
-            i1 += 1
-            i2 += 1
-    if is_equal:
-        return len(keys_a) < len(keys_b)
-    return True
-
-def _lt_helper_sequence(a, b):
-    is_equal = True
-    for v1, v2 in zip(a, b):
-        if _lt_helper(v1, v2):
-            is_equal = False
-        elif is_equal and _lt_helper(v2, v1):
-            return False
-    if is_equal:
-        return len(a) < len(b)
-    return True
-
-def _lt_helper(a, b):
-    i1 = get_type_index(a)
-    i2 = get_type_index(b)
-    if i1 != i2:
-        return i1 < i2
-    if a is None:
-        # b must be None
-        return False
-    if isinstance(a, dict):
-        return _lt_helper_dict(a, b)
-    if isinstance(a, list) \
-            or isinstance(a, tuple):
-        return _lt_helper_sequence(a, b)
-    return a < b
-
 # def has_annotation(cls: type, expected: str) -> bool:
 #     prev_annotations = None
 #     for cls in cls.__mro__:
@@ -88,120 +36,477 @@ def _lt_helper(a, b):
 #             return subcls
 #     raise NameError(f"class named '{name}' not found")
 
+_SLOT_DEFAULTS_ATTR_NAME = '__record_slot_defaults__'
+
+_leaf_classes = tuple(primitive_types) + (bytes,)
+
+_container_origins = (list, tuple, set, frozenset, dict, typing.Union, types.UnionType)
+
+def _may_contain_records(ty: Any, seen: set[int] | None = None) -> bool:
+    """
+    Conservatively determine whether a value of type `ty` might hold a
+    record somewhere inside it.
+    """
+    if ty is None or ty is Ellipsis:
+        return False
+    if isinstance(ty, typing.NewType):
+        return _may_contain_records(ty.__supertype__, seen)
+    if isinstance(ty, typing.TypeAliasType):
+        if seen is None:
+            seen = set()
+        if id(ty) in seen:
+            return False
+        seen.add(id(ty))
+        return _may_contain_records(ty.__value__, seen)
+    # Both typing.Callable and collections.abc.Callable have the latter as
+    # their origin, but without arguments the latter has none
+    if ty is collections.abc.Callable:
+        return False
+    origin = typing.get_origin(ty)
+    if origin is None:
+        return not (isinstance(ty, type) and issubclass(ty, _leaf_classes))
+    if origin is typing.Literal:
+        return False
+    if origin in _container_origins:
+        return any(_may_contain_records(arg, seen) for arg in typing.get_args(ty))
+    if origin is collections.abc.Callable:
+        return False
+    return True
+
+type _FieldsFn = Callable[[Any], tuple[tuple[str, Any], ...]]
+
+def _compile_fields_getter(field_names: tuple[str, ...]) -> _FieldsFn:
+    items = ''.join(f'({name!r}, self.{name}), ' for name in field_names)
+    env = dict[str, Any]()
+    exec(f'def get_fields(self):\n    return ({items})\n', env)
+    return env['get_fields']
+
 def get_defaults(cls: type) -> dict[str, Any]:
     result = dict()
     for pcls in inspect.getmro(cls):
+        # Slotted records can't keep their defaults as class attributes
+        for k, v in pcls.__dict__.get(_SLOT_DEFAULTS_ATTR_NAME, {}).items():
+            if k not in result:
+                result[k] = v
         for k, v in pcls.__dict__.items():
-            if k not in result and not k.startswith('__'):
+            if k not in result and not k.startswith('__') and not isinstance(v, types.MemberDescriptorType):
                 result[k] = v
     return result
 
+class ValidationLevel(IntEnum):
+    """
+    How thoroughly field values are checked against their annotations.
+    """
+
+    OFF     = 0
+    "Do not check field values at all."
+    SHALLOW = 1
+    "Check field values but not the elements of containers."
+    DEEP    = 2
+    "Check field values including all elements of containers."
+
+_validation_level = ValidationLevel.DEEP
+
+_VALIDATION_ATTR_NAME = '__record_validation__'
+
+def get_validation_level(cls: type | None = None) -> ValidationLevel:
+    """
+    Get the validation level that is in effect for `cls`, or the global
+    validation level if no class is given.
+    """
+    if cls is not None:
+        level = getattr(cls, _VALIDATION_ATTR_NAME, None)
+        if level is not None:
+            return level
+    return _validation_level
+
+def set_validation_level(level: ValidationLevel, cls: type | None = None) -> None:
+    """
+    Set the validation level of `cls` and its subclasses, or the global
+    validation level that is used by all records that do not specify one.
+    """
+    global _validation_level
+    if cls is None:
+        _validation_level = level
+        cls = Record
+    else:
+        setattr(cls, _VALIDATION_ATTR_NAME, level)
+    invalidate_schema(cls)
+
+_NO_CHECKS = dict[str, TypeCheckFn]()
+
+class RecordSchema:
+    """
+    The field layout of a record class.
+
+    Resolving type hints and defaults is expensive, so this information is
+    computed once per class and shared by all of its instances. Use
+    `get_schema()` to obtain the schema of a class.
+    """
+
+    def __init__(self, cls: type) -> None:
+        # A copy, so that changes to the annotations in place are noticed
+        annotations = cls.__dict__.get('__annotations__')
+        self.annotations = None if annotations is None else dict(annotations)
+        self.types: dict[str, Any] = typing.get_type_hints(cls)
+        self.validation: ValidationLevel | None = getattr(cls, _VALIDATION_ATTR_NAME, None)
+        self.deep_checks: dict[str, TypeCheckFn] = { name: compile_type_check(ty) for name, ty in self.types.items() }
+        self.shallow_checks: dict[str, TypeCheckFn] = { name: compile_type_check(ty, shallow=True) for name, ty in self.types.items() }
+        defaults = get_defaults(cls)
+        self.defaults: dict[str, Any] = { name: defaults[name] for name in self.types if name in defaults }
+        self.field_names = tuple(self.types.keys())
+        self.required = tuple(name for name in self.field_names if name not in self.defaults)
+        self.optional = tuple(name for name in self.field_names if name in self.defaults)
+        # The order in which positional arguments are assigned to fields
+        self.parameters = self.required + self.optional
+        self.post_init: Callable[[Any], None] | None = getattr(cls, '__post_init__', None)
+        # Fields that might hold other records, which is what traversals
+        # that look for nodes need to visit
+        self.child_fields = tuple(name for name in self.field_names if _may_contain_records(self.types[name]))
+        self.get_fields: _FieldsFn = _compile_fields_getter(self.field_names)
+        self.get_child_fields: _FieldsFn = _compile_fields_getter(self.child_fields)
+        # Fields stored in slots can't be written through the instance's __dict__
+        self.slotted = cls.__dictoffset__ == 0 \
+            or any(isinstance(getattr(cls, name, None), types.MemberDescriptorType) for name in self.field_names)
+
+    def get_validation_level(self) -> ValidationLevel:
+        return self.validation if self.validation is not None else _validation_level
+
+    def get_checks(self) -> dict[str, TypeCheckFn]:
+        """
+        Get the type checks of the fields according to the validation level
+        that is currently in effect. Fields that should not be checked are
+        absent from the result.
+        """
+        level = self.get_validation_level()
+        if level == ValidationLevel.DEEP:
+            return self.deep_checks
+        if level == ValidationLevel.SHALLOW:
+            return self.shallow_checks
+        return _NO_CHECKS
+
+_SCHEMA_ATTR_NAME = '__record_schema__'
+
+def get_schema(cls: type) -> RecordSchema:
+    """
+    Get the cached schema of a record class, building it if needed.
+
+    The schema is rebuilt automatically when the annotations of `cls` are
+    replaced or changed in place. If the annotations of a base class or of a
+    compiled record are changed, call `invalidate_schema()` on that class,
+    because neither is checked when a record is constructed.
+    """
+    schema = cls.__dict__.get(_SCHEMA_ATTR_NAME)
+    if schema is None or schema.annotations != cls.__dict__.get('__annotations__'):
+        if schema is not None:
+            invalidate_schema(cls)
+        schema = RecordSchema(cls)
+        setattr(cls, _SCHEMA_ATTR_NAME, schema)
+    return schema
+
+def invalidate_schema(cls: type) -> None:
+    """
+    Drop the cached schema of `cls` and all of its subclasses.
+
+    Generated constructors of compiled records are dropped as well and will
+    be regenerated on the next construction.
+    """
+    stack = [ cls ]
+    while stack:
+        cls = stack.pop()
+        if _SCHEMA_ATTR_NAME in cls.__dict__:
+            delattr(cls, _SCHEMA_ATTR_NAME)
+        if _is_generated(cls.__dict__.get('__init__')):
+            cls.__init__ = _make_lazy_init(cls)
+        stack.extend(cls.__subclasses__())
+
+_MISSING = object()
+
+_PENDING = object()
+
+def _coerce_missing(name: str, ty: Any) -> Any:
+    try:
+        return coerce(None, ty)
+    except CoercionError:
+        raise TypeError(f"argument '{name}' is required but did not receive a value")
+
+def _is_immutable(value: Any) -> bool:
+    if type(value) in primitive_types:
+        return True
+    if type(value) is tuple:
+        return all(_is_immutable(element) for element in value)
+    return False
+
+def _is_generated(init: Any) -> bool:
+    return getattr(init, '__record_generated__', False)
+
+class _InitBuilder:
+
+    def __init__(self) -> None:
+        self.env = dict[str, Any]()
+        self.lines = list[str]()
+        # Fields are parameters of the generated code, so builtins have to
+        # be reached under names that no field can shadow
+        self.isinstance = self.add_global(isinstance)
+        self.all = self.add_global(all)
+        self.type_error = self.add_global(TypeError)
+
+    def add_global(self, value: Any) -> str:
+        name = f'__sw_{len(self.env)}'
+        self.env[name] = value
+        return name
+
+    def fresh_name(self) -> str:
+        return self.add_global(None)
+
+    def type_check(self, value: str, ty: Any, shallow: bool) -> str | None:
+        """
+        Generate an expression that checks whether `value` satisfies `ty`.
+
+        Returns `None` if every value satisfies the type.
+        """
+        if ty is typing.Any or ty is object:
+            return None
+        if ty is None or ty is type(None):
+            return f'{value} is None'
+        if isinstance(ty, typing.NewType):
+            return self.type_check(value, ty.__supertype__, shallow)
+        if isinstance(ty, typing.TypeAliasType):
+            # Aliases may be recursive, so they are not inlined
+            return f'{self.add_global(compile_type_check(ty, shallow))}({value})'
+        origin = typing.get_origin(ty)
+        if origin is None and isinstance(ty, type):
+            return f'{self.isinstance}({value}, {self.add_global(ty)})'
+        args = typing.get_args(ty)
+        if origin is typing.Union or origin is types.UnionType:
+            classes = []
+            checks = []
+            for arg in args:
+                if arg is not type(None) and typing.get_origin(arg) is None and isinstance(arg, type):
+                    classes.append(arg)
+                    continue
+                check = self.type_check(value, arg, shallow)
+                if check is None:
+                    return None
+                checks.append(check)
+            if classes:
+                checks.insert(0, f'{self.isinstance}({value}, {self.add_global(tuple(classes))})')
+            return '(' + ' or '.join(checks) + ')'
+        if origin is list or origin is set:
+            container = f'{self.isinstance}({value}, {self.add_global(origin)})'
+            if shallow:
+                return container
+            element = self.fresh_name()
+            check = self.type_check(element, args[0], shallow)
+            if check is None:
+                return container
+            return f'({container} and {self.all}({check} for {element} in {value}))'
+        return f'{self.add_global(compile_type_check(ty, shallow))}({value})'
+
+    def emit(self, line: str, indent: int = 1) -> None:
+        self.lines.append('    ' * indent + line)
+
+def _check_compilable(cls: type) -> None:
+    for pcls in cls.__mro__:
+        if pcls is Record:
+            break
+        init = pcls.__dict__.get('__init__')
+        if init is not None and not _is_generated(init):
+            raise TypeError(f"compiled record {pcls.__name__} may not define __init__; use __post_init__ instead")
+
+def _compile_init(cls: type) -> Callable[..., None]:
+    """
+    Generate a constructor that is specialised for the fields of `cls`.
+
+    The generated constructor behaves like `Record.__init__` but has all
+    parameters spelled out, clones only those defaults that are mutable and
+    inlines type checks for common annotations.
+    """
+    schema = get_schema(cls)
+    level = schema.get_validation_level()
+    shallow = level == ValidationLevel.SHALLOW
+    builder = _InitBuilder()
+    missing = builder.add_global(_MISSING)
+    self_name = builder.fresh_name()
+    params = [ self_name ] + [ f'{name}={missing}' for name in schema.parameters ]
+    builder.emit(f'def __init__({", ".join(params)}):', 0)
+    if schema.slotted:
+        setattr_name = builder.add_global(object.__setattr__)
+        def store(name: str) -> None:
+            builder.emit(f'{setattr_name}({self_name}, {name!r}, {name})')
+    else:
+        dict_name = builder.fresh_name()
+        builder.emit(f'{dict_name} = {self_name}.__dict__')
+        def store(name: str) -> None:
+            builder.emit(f'{dict_name}[{name!r}] = {name}')
+    for name in schema.required:
+        ty = builder.add_global(schema.types[name])
+        builder.emit(f'if {name} is {missing}:')
+        builder.emit(f'{name} = {builder.add_global(_coerce_missing)}({name!r}, {ty})', 2)
+        check = None if level == ValidationLevel.OFF else builder.type_check(name, schema.types[name], shallow)
+        if check is not None:
+            builder.emit(f'elif not {check}:')
+            builder.emit(f'{name} = {builder.add_global(coerce)}({name}, {ty})', 2)
+        store(name)
+    for name in schema.optional:
+        default = schema.defaults[name]
+        builder.emit(f'if {name} is {missing}:')
+        if _is_immutable(default):
+            builder.emit(f'{name} = {builder.add_global(default)}', 2)
+        else:
+            builder.emit(f'{name} = {builder.add_global(clone)}({builder.add_global(default)})', 2)
+        check = None if level == ValidationLevel.OFF else builder.type_check(name, schema.types[name], shallow)
+        if check is not None:
+            builder.emit(f'elif not {check}:')
+            builder.emit(f'raise {builder.type_error}(f"{{{name}}} did not satisfy type {{{builder.add_global(schema.types[name])}}}")', 2)
+        store(name)
+    if schema.post_init is not None:
+        builder.emit(f'{builder.add_global(schema.post_init)}({self_name})')
+    source = '\n'.join(builder.lines) + '\n'
+    env = builder.env
+    exec(source, env)
+    init = env['__init__']
+    init.__qualname__ = f'{cls.__qualname__}.__init__'
+    init.__module__ = cls.__module__
+    setattr(init, '__record_generated__', True)
+    setattr(init, '__record_source__', source)
+    return init
+
+def _make_lazy_init(cls: type) -> Callable[..., None]:
+    def __init__(self, *args, **kwargs) -> None:
+        init = _compile_init(cls)
+        cls.__init__ = init
+        init(self, *args, **kwargs)
+    setattr(__init__, '__record_generated__', True)
+    return __init__
+
 class RecordFields:
 
     def __init__(self, record) -> None:
         self.record = record
 
     def __contains__(self, key: str) -> bool:
-        hints = typing.get_type_hints(type(self.record))
-        return key in hints
+        return key in get_schema(type(self.record)).types
 
     def __getitem__(self, key: str) -> Any:
-        hints = typing.get_type_hints(type(self.record))
-        if key not in hints:
+        if key not in get_schema(type(self.record)).types:
             raise KeyError(f"key '{key}' is not found in the fields of {self.record}")
         return getattr(self.record, key)
 
     def __setitem__(self, key: str, new_value: typing.Any) -> None:
-        hints = typing.get_type_hints(type(self.record))
-        if key not in hints:
+        if key not in get_schema(type(self.record)).types:
             raise KeyError(f"key '{key}' is not found in the fields of {self.record}")
         setattr(self.record, key, new_value)
 
     def keys(self) -> Iterable[str]:
-        hints = typing.get_type_hints(type(self.record))
-        return hints.keys()
+        return get_schema(type(self.record)).field_names
 
     def values(self) -> Iterable[Any]:
-        for key in typing.get_type_hints(type(self.record)):
+        for key in get_schema(type(self.record)).field_names:
             yield getattr(self.record, key)
 
     def items(self) -> Iterable[tuple[str, Any]]:
-        for name in typing.get_type_hints(type(self.record)):
+        for name in get_schema(type(self.record)).field_names:
             yield name, getattr(self.record, name)
 
 
-def transform(value: _T, proc) -> _T:
+type TransformFn = Callable[[Any], Any]
 
-    new_value = proc(value)
-    if new_value != value:
-        return new_value
+class _TransformFrame:
 
-    for cls in primitive_types:
-        if isinstance(value, cls):
-            return value
+    def __init__(self, value: Any, keys: list[Any], children: list[Any]) -> None:
+        self.value = value
+        self.keys = keys
+        self.children = children
+        self.results = list[Any]()
+        self.has_new_child = False
 
-    if isinstance(value, tuple):
-        new_elements = []
-        has_new_element = False
-        for element in value:
-            new_element = transform(element, proc)
-            if new_element != element:
-                has_new_element = True
-            new_elements.append(new_element)
-        if not has_new_element:
-            return value
-        return cast(_T, tuple(new_elements))
+def _get_transform_children(value: Any) -> tuple[list[Any], list[Any]]:
+    if isinstance(value, (tuple, list, set)):
+        return [], list(value)
+    if isinstance(value, Record):
+        fields = get_schema(type(value)).get_fields(value)
+        return [ k for k, _v in fields ], [ v for _k, v in fields ]
+    if isinstance(value, dict):
+        return list(value.keys()), list(value.values())
+    raise RuntimeError(f'unexpected {value}')
 
+def _rebuild(frame: _TransformFrame) -> Any:
+    value = frame.value
+    if not frame.has_new_child:
+        return value
+    results = frame.results
+    if isinstance(value, tuple):
+        return tuple(results)
     if isinstance(value, list):
-        new_elements = []
-        has_new_element = False
-        for element in value:
-            new_element = transform(element, proc)
-            if new_element != element:
-                has_new_element = True
-            new_elements.append(new_element)
-        if not has_new_element:
-            return value
-        return cast(_T, new_elements)
-
+        return results
     if isinstance(value, set):
-        new_elements = set()
-        has_new_element = False
-        for element in value:
-            new_element = transform(element, proc)
-            if new_element != element:
-                has_new_element = True
-            new_elements.add(new_element)
-        if not has_new_element:
-            return value
-        return cast(_T, new_elements)
-
+        return set(results)
     if isinstance(value, Record):
-        cls = value.__class__
-        kwargs = dict()
-        has_new_v = False
-        for k, v in value.fields.items():
-            new_v = transform(v, proc)
-            if new_v != v:
-                has_new_v = True
-            kwargs[k] = new_v
-        if not has_new_v:
-            return value
-        return cls(**kwargs)
+        return value.__class__(**dict(zip(frame.keys, results)))
+    return dict(zip(frame.keys, results))
 
-    if isinstance(value, dict):
-        new_value = dict()
-        has_new_v = False
-        for k, v in value.items():
-            new_v = transform(v, proc)
-            if new_v != v:
-                has_new_v = True
-            new_value[k] = new_v
-        if not has_new_v:
-            return value
-        return cast(_T, new_value)
+def transform(value: _T, proc: TransformFn, post: TransformFn | None = None, identity: bool = False) -> _T:
+    """
+    Rewrite a tree of records and containers.
 
-    raise RuntimeError(f'unexpected {value}')
+    `proc` is called on each value before its children. If it returns a
+    different value, that value replaces the subtree as a whole. Otherwise
+    the children are transformed and a new container or record is only built
+    when one of them changed, so unchanged subtrees are shared with the
+    input. If `post` is given, it is called on each value that was not
+    replaced by `proc` after its children were transformed.
+
+    By default a value counts as changed when it compares unequal to the
+    original, which for records and containers means a structural comparison
+    at every level of the tree. Pass `identity=True` to compare with `is`
+    instead, which makes a rewrite of the whole tree run in linear time. In
+    this mode `proc` and `post` must return the very same object to signal
+    that nothing changed.
+
+    The tree is traversed with an explicit stack, so deep trees do not
+    exceed Python's recursion limit. The same goes for the other functions
+    in this package that walk a whole tree, such as `compare.eq()`,
+    `structural_hash()`, `sort_key()`, `set_parent_nodes()` and `Visitor`.
+    """
+
+    stack = list[_TransformFrame]()
+
+    def enter(value: Any) -> Any:
+        new_value = proc(value)
+        if (new_value is not value) if identity else (new_value != value):
+            return new_value
+        if isinstance(value, _leaf_classes):
+            return value if post is None else post(value)
+        keys, children = _get_transform_children(value)
+        stack.append(_TransformFrame(value, keys, children))
+        return _PENDING
+
+    result = enter(value)
+
+    while stack:
+        frame = stack[-1]
+        i = len(frame.results)
+        if i < len(frame.children):
+            child = frame.children[i]
+            new_child = enter(child)
+            if new_child is _PENDING:
+                continue
+        else:
+            stack.pop()
+            new_child = _rebuild(frame)
+            if post is not None:
+                new_child = post(new_child)
+            if not stack:
+                result = new_child
+                break
+            frame = stack[-1]
+            child = frame.children[len(frame.results)]
+        if (new_child is not child) if identity else (new_child != child):
+            frame.has_new_child = True
+        frame.results.append(new_child)
+
+    return cast(_T, result)
 
 def _record_clone_helper(value, deep: bool):
     if isinstance(value, dict):
@@ -217,15 +522,55 @@ def _record_clone_helper(value, deep: bool):
 @reflect
 class Record:
 
+    # Subclasses get a __dict__ unless they are made @slotted
+    __slots__ = ('__weakref__',)
+
+    def __init_subclass__(cls, compiled: bool | None = None, validation: ValidationLevel | None = None, frozen: bool | None = None, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        if compiled is not None:
+            cls.__record_compiled__ = compiled
+        if frozen is not None:
+            cls.__record_frozen__ = frozen
+            if frozen:
+                cls.__setattr__ = _frozen_setattr
+                cls.__eq__ = _frozen_eq
+                cls.__hash__ = _frozen_hash
+            else:
+                cls.__setattr__ = Record.__setattr__
+                cls.__eq__ = object.__eq__
+                cls.__hash__ = object.__hash__
+        if validation is not None:
+            setattr(cls, _VALIDATION_ATTR_NAME, validation)
+        try:
+            get_schema(cls)
+        except NameError:
+            # Some forward references can't be resolved yet. The schema will
+            # be built on first use instead.
+            pass
+        if getattr(cls, '__record_compiled__', False):
+            _check_compilable(cls)
+            try:
+                cls.__init__ = _compile_init(cls)
+            except NameError:
+                cls.__init__ = _make_lazy_init(cls)
+        elif _is_generated(getattr(cls, '__init__')):
+            # A compiled base class must not hand its constructor down to a
+            # class that opted out
+            cls.__init__ = Record.__init__
+
     def __init__(self, *args, **kwargs):
 
-        type_hints = typing.get_type_hints(self.__class__)
-        defaults = get_defaults(self.__class__)
+        schema = get_schema(self.__class__)
+        types = schema.types
+        checks = schema.get_checks()
+        if schema.slotted:
+            store = partial(object.__setattr__, self)
+        else:
+            store = self.__dict__.__setitem__
         i = 0
 
-        for name, ty in type_hints.items():
-            if name in defaults:
-                continue
+        for name in schema.required:
+            ty = types[name]
             if name in kwargs:
                 value = kwargs[name]
                 del kwargs[name]
@@ -233,18 +578,14 @@ class Record:
                 value = args[i]
                 i += 1
             else:
-                try:
-                    value = coerce(None, ty)
-                except CoercionError:
-                    raise TypeError(f"argument '{name}' is required but did not receive a value")
-            if not satisfies_type(value, ty):
+                value = _coerce_missing(name, ty)
+            check = checks.get(name)
+            if check is not None and not check(value):
                 value = coerce(value, ty)
-            self.__dict__[name] = value
+            store(name, value)
 
-        for name, ty in type_hints.items():
-            if name not in defaults:
-                continue
-            ty = type_hints[name]
+        for name in schema.optional:
+            ty = types[name]
             if name in kwargs:
                 value = kwargs[name]
                 del kwargs[name]
@@ -255,10 +596,11 @@ class Record:
                 # We do a clone here so we can e.g. assign an empty list to the
                 # default of a field and still be sure that each construction
                 # of the record has an unique empty list
-                value = clone(defaults[name])
-            if not satisfies_type(value, ty):
+                value = clone(schema.defaults[name])
+            check = checks.get(name)
+            if check is not None and not check(value):
                 raise TypeError(f"{value} did not satisfy type {ty}")
-            self.__dict__[name] = value
+            store(name, value)
 
         if i < len(args) or len(kwargs) > 0:
             parts = []
@@ -268,8 +610,11 @@ class Record:
                 parts.append(f"'{k}'")
             raise TypeError(f'excess arguments received to {get_class_name(self)}: {pretty_enumerate(parts)}')
 
+        if schema.post_init is not None:
+            schema.post_init(self)
+
     def get_field_names(self):
-        return typing.get_type_hints(self).keys()
+        return get_schema(type(self)).field_names
 
     @property
     def fields(self) -> RecordFields:
@@ -282,20 +627,14 @@ class Record:
         return self.fields.keys()
 
     def _equal(self, other) -> bool:
-        if self.__class__ != other.__class__:
-            return False
-        for k1, v1 in self.fields.items():
-            if other[k1] != v1:
-                return False
-        return True
+        from .compare import eq
+        return eq(self, other)
 
     def _expand(self) -> Iterable[tuple[str, Any]]:
-        return self.fields.items()
+        return get_schema(type(self)).get_fields(self)
 
     def __lt__(self, other) -> bool:
-        if not isinstance(other, Record):
-            return _lt_helper(self, other)
-        return _lt_helper(self.fields, other.fields)
+        return sort_key(self) < sort_key(other)
 
     def __getitem__(self, name: str):
         return self.fields[name]
@@ -304,17 +643,75 @@ class Record:
         self.fields[key] = new_value
 
     def __setattr__(self, name: str, new_value: Any) -> None:
-        hints = typing.get_type_hints(type(self))
-        if name in hints:
-            ty = hints[name]
-            if not satisfies_type(new_value, ty):
-                raise RuntimeError(f"cannot set field '{name}' to {new_value} on {get_class_name(self)} because the type {ty} is not satisfied")
+        schema = get_schema(type(self))
+        check = schema.get_checks().get(name)
+        if check is not None and not check(new_value):
+            ty = schema.types[name]
+            raise RuntimeError(f"cannot set field '{name}' to {new_value} on {get_class_name(self)} because the type {ty} is not satisfied")
         super().__setattr__(name, new_value)
 
+    def replace(self, **changes: Any) -> Self:
+        """
+        Return a copy of this record where the fields in `changes` have new
+        values.
+
+        The values of the other fields are shared with this record and are not
+        checked again. The new values are checked and coerced in the same way
+        as the constructor does.
+        """
+        cls = type(self)
+        schema = get_schema(cls)
+        types = schema.types
+        checks = schema.get_checks()
+        new = cls.__new__(cls)
+        if schema.slotted:
+            store = partial(object.__setattr__, new)
+        else:
+            store = new.__dict__.__setitem__
+        for name in schema.field_names:
+            if name not in changes:
+                store(name, getattr(self, name))
+                continue
+            value = changes.pop(name)
+            check = checks.get(name)
+            if check is not None and not check(value):
+                if name in schema.defaults:
+                    raise TypeError(f"{value} did not satisfy type {types[name]}")
+                value = coerce(value, types[name])
+            store(name, value)
+        if changes:
+            parts = list(f"'{k}'" for k in changes)
+            raise TypeError(f'excess arguments received to {get_class_name(self)}: {pretty_enumerate(parts)}')
+        if schema.post_init is not None:
+            schema.post_init(new)
+        if isinstance(cls, _InternedRecordType):
+            new = cls._intern(new)
+        return new
+
+    def update_in(self, path: Sequence[Any], new_value: Any) -> Self:
+        """
+        Return a copy of this record where the value at `path` is replaced
+        with `new_value`.
+
+        `path` is a sequence of field names, list indices and dictionary keys.
+        Only the records and containers along `path` are copied. Everything
+        else is shared with this record.
+        """
+        spine = []
+        value = self
+        for key in path:
+            spine.append(value)
+            value = resolve(value, key)
+        if value is new_value:
+            return self
+        for i in reversed(range(len(spine))):
+            new_value = _replace_key(spine[i], path[i], new_value)
+        return new_value
+
     def clone(self, deep=False) -> Self:
         new_fields = dict()
-        for k, v in self.fields.items():
-            new_fields[k] = _record_clone_helper(v, deep)
+        for k in get_schema(type(self)).field_names:
+            new_fields[k] = _record_clone_helper(getattr(self, k), deep)
         return self.__class__(**new_fields)
 
     def to_primitive(self) -> dict[str, Any]:
@@ -327,8 +724,8 @@ class Record:
             if isinstance(value, Record):
                 return value.to_primitive()
             return value
-        for k, v in self.fields.items():
-            fields[k] = encode(v)
+        for k in get_schema(type(self)).field_names:
+            fields[k] = encode(getattr(self, k))
         return fields
 
     def dump(self) -> None:
@@ -343,13 +740,328 @@ class Record:
 
 _Record = TypeVar('_Record', bound=Record)
 
+def _replace_key(value: Any, key: Any, new_child: Any) -> Any:
+    if isinstance(value, Record):
+        return value.replace(**{ key: new_child })
+    if isinstance(value, list):
+        new_value = list(value)
+        new_value[key] = new_child
+        return new_value
+    if isinstance(value, tuple):
+        return value[:key] + (new_child,) + value[key+1:]
+    if isinstance(value, dict):
+        new_value = dict(value)
+        new_value[key] = new_child
+        return new_value
+    raise TypeError(f'could not determine how to replace key {key} in {value}')
+
+def _get_slots(cls: type) -> tuple[str, ...]:
+    slots = cls.__dict__.get('__slots__', ())
+    return (slots,) if isinstance(slots, str) else tuple(slots)
+
+def _rebind_class_cells(value: Any, old_cls: type, new_cls: type) -> None:
+    # Methods that use super() or __class__ refer to the class through a closure cell
+    if isinstance(value, (classmethod, staticmethod)):
+        value = value.__func__
+    if isinstance(value, property):
+        for accessor in (value.fget, value.fset, value.fdel):
+            _rebind_class_cells(accessor, old_cls, new_cls)
+        return
+    for cell in getattr(value, '__closure__', None) or ():
+        try:
+            if cell.cell_contents is old_cls:
+                cell.cell_contents = new_cls
+        except ValueError:
+            # Empty cell
+            pass
+
+def slotted(cls: type[_Record]) -> type[_Record]:
+    """
+    A class decorator that stores the fields of a record in `__slots__`
+    instead of in a per-instance `__dict__`, which saves a lot of memory when
+    many instances are created.
+
+    Like `dataclasses.dataclass(slots=True)`, this creates a new class. All
+    base classes up to `Record` must have `__slots__` as well, so in a
+    hierarchy every class should be decorated.
+    """
+    for pcls in cls.__mro__[1:]:
+        if pcls is Record:
+            break
+        if '__slots__' not in pcls.__dict__:
+            raise TypeError(f"cannot make {cls.__name__} slotted because its base class {pcls.__name__} has no __slots__")
+    inherited = set()
+    for pcls in cls.__mro__[1:]:
+        inherited.update(_get_slots(pcls))
+    own = tuple(name for name in get_schema(cls).field_names if name not in inherited)
+    ns = dict(cls.__dict__)
+    for name in ('__dict__', '__weakref__', _SCHEMA_ATTR_NAME):
+        ns.pop(name, None)
+    if _is_generated(ns.get('__init__')):
+        # The new class will generate its own constructor
+        del ns['__init__']
+    defaults = dict()
+    for name in own:
+        if name in ns:
+            defaults[name] = ns.pop(name)
+    ns['__slots__'] = own
+    if getattr(cls, _FROZEN_ATTR_NAME, False):
+        _add_cache_slots(ns, cls.__bases__)
+    ns[_SLOT_DEFAULTS_ATTR_NAME] = defaults
+    ns['__qualname__'] = cls.__qualname__
+    new_cls = type(cls)(cls.__name__, cls.__bases__, ns)
+    for value in ns.values():
+        _rebind_class_cells(value, cls, new_cls)
+    return cast(type[_Record], new_cls)
+
+_HASH_ATTR_NAME = '__record_hash__'
+
+_SORT_KEY_ATTR_NAME = '__record_sort_key__'
+
+_FROZEN_ATTR_NAME = '__record_frozen__'
+
+def _add_cache_slots(ns: dict[str, Any], bases: tuple[type, ...]) -> None:
+    # Frozen records need somewhere to cache their hash and sort key
+    if any(_HASH_ATTR_NAME in _get_slots(pcls) for base in bases for pcls in base.__mro__):
+        return
+    slots = ns['__slots__']
+    ns['__slots__'] = ((slots,) if isinstance(slots, str) else tuple(slots)) + (_HASH_ATTR_NAME, _SORT_KEY_ATTR_NAME)
+
+def is_frozen(value: Any) -> bool:
+    """
+    Check whether `value` is a record whose fields can't be assigned to.
+    """
+    return getattr(type(value), _FROZEN_ATTR_NAME, False)
+
+def structural_hash(value: Any) -> int:
+    """
+    Compute a hash of `value` that is consistent with `compare.eq()`.
+
+    Records, lists, tuples and dictionaries are hashed by their contents.
+    The hash of a frozen record is cached on the record, so it is only
+    computed once. Other records are hashed again each time because their
+    fields might change.
+    """
+    results = list[int]()
+    # A pending entry holds the value and the amount of hashes of its
+    # children that have to be combined
+    stack: list[tuple[Any, int]] = [ (value, -1) ]
+    while stack:
+        value, count = stack.pop()
+        if count >= 0:
+            start = len(results) - count
+            h = hash((type(value), *results[start:]))
+            del results[start:]
+            if is_frozen(value):
+                try:
+                    object.__setattr__(value, _HASH_ATTR_NAME, h)
+                except AttributeError:
+                    # A slotted record without room for the hash
+                    pass
+            results.append(h)
+            continue
+        if isinstance(value, _leaf_classes):
+            results.append(hash(value))
+            continue
+        if isinstance(value, Record):
+            h = getattr(value, _HASH_ATTR_NAME, None)
+            if h is not None:
+                results.append(h)
+                continue
+            children = [ v for _k, v in get_schema(type(value)).get_fields(value) ]
+        elif isinstance(value, (list, tuple)):
+            children = value
+        elif isinstance(value, dict):
+            children = [ x for item in value.items() for x in item ]
+        else:
+            # Values that compare.eq() does not look into can only be
+            # equal to themselves, so any fixed hash is consistent
+            results.append(hash(type(value)))
+            continue
+        stack.append((value, len(children)))
+        for child in reversed(children):
+            stack.append((child, -1))
+    return results[0]
+
+def _get_order_index(value: Any) -> int:
+    # All records are ordered among each other by their fields
+    return get_type_index(Record if isinstance(value, Record) else type(value))
+
+# Closes the tokens of a list, tuple, dictionary or record in a sort key. It
+# is smaller than the type index that starts every value, so that shorter
+# sequences come first.
+_SORT_KEY_CLOSE = -1
+
+_sort_key_leaf_classes = tuple(primitive_types)
+
+def sort_key(value: Any) -> tuple:
+    """
+    Compute a key for `value` that orders it the same way as `Record.__lt__`.
+
+    Values are first ordered by their type: `None`, then `bool`, `int`,
+    `float`, `complex`, `str`, `tuple`, `list`, `dict` and finally records.
+    Values of the same type are compared like this:
+
+     - Lists and tuples are compared element by element.
+     - Dictionaries are compared item by item after sorting them by key.
+     - Records are compared like dictionaries of their fields. Records with
+       equal fields are ordered by the name of their class.
+
+    The key is a flat tuple of tokens that lists the values in preorder, so
+    e.g. `sorted(records, key=sort_key)` runs at the speed of Python's
+    built-in tuple comparison, no matter how deeply the values are nested.
+    The key of a frozen record is cached on the record.
+    """
+    key = getattr(value, _SORT_KEY_ATTR_NAME, None) if isinstance(value, Record) else None
+    if key is not None:
+        return key
+    tokens = list[Any]()
+    # Holds values that still have to be encoded and, wrapped in a tuple,
+    # tokens that have to be written as-is
+    stack: list[tuple[bool, Any]] = [ (False, value) ]
+    while stack:
+        is_tokens, item = stack.pop()
+        if is_tokens:
+            tokens.extend(item)
+            continue
+        if item is None:
+            tokens.append(_get_order_index(item))
+            continue
+        if isinstance(item, _sort_key_leaf_classes):
+            tokens.append(_get_order_index(item))
+            tokens.append(item)
+            continue
+        if isinstance(item, Record):
+            cached = getattr(item, _SORT_KEY_ATTR_NAME, None)
+            if cached is not None:
+                tokens.extend(cached)
+                continue
+            tokens.append(_get_order_index(item))
+            stack.append((True, (_SORT_KEY_CLOSE, type(item).__qualname__)))
+            # Field names are unique, so ordering the fields by name is
+            # enough
+            str_index = get_type_index(str)
+            for name, field_value in sorted(get_schema(type(item)).get_fields(item), key=lambda field: field[0], reverse=True):
+                stack.append((False, field_value))
+                stack.append((True, (str_index, name)))
+        elif isinstance(item, (list, tuple)):
+            tokens.append(_get_order_index(item))
+            stack.append((True, (_SORT_KEY_CLOSE,)))
+            for element in reversed(item):
+                stack.append((False, element))
+        elif isinstance(item, dict):
+            tokens.append(_get_order_index(item))
+            stack.append((True, (_SORT_KEY_CLOSE,)))
+            # Keys are unique, so ordering the items by key is enough
+            for k, v in sorted(((sort_key(k), v) for k, v in item.items()), key=lambda kv: kv[0], reverse=True):
+                stack.append((False, v))
+                stack.append((True, k))
+        else:
+            raise TypeError(f'cannot compute a sort key for {item!r}')
+    key = tuple(tokens)
+    if isinstance(value, Record) and is_frozen(value):
+        try:
+            object.__setattr__(value, _SORT_KEY_ATTR_NAME, key)
+        except AttributeError:
+            # A slotted record without room for the key
+            pass
+    return key
+
+def _frozen_setattr(self, name: str, new_value: Any) -> None:
+    if name in get_schema(type(self)).types:
+        raise RuntimeError(f"cannot set field '{name}' on {get_class_name(self)} because it is frozen")
+    super(Record, self).__setattr__(name, new_value)
+
+def _frozen_eq(self, other: Any) -> bool:
+    if not isinstance(other, Record):
+        return NotImplemented
+    from .compare import eq
+    return eq(self, other)
+
+def _frozen_hash(self) -> int:
+    h = getattr(self, _HASH_ATTR_NAME, None)
+    return structural_hash(self) if h is None else h
+
+# Maps the class and the field values of a record to the one instance that
+# has these values
+_intern_table = weakref.WeakValueDictionary[Any, Any]()
+
+def _get_intern_key(value: Any) -> Any:
+    if isinstance(value, Record):
+        # Interned records can be compared by identity. Other records are
+        # only shared if they are the same object. The record that holds
+        # `value` keeps it alive for as long as the key is in the table.
+        return id(value)
+    if isinstance(value, (list, tuple)):
+        return (type(value), tuple(_get_intern_key(element) for element in value))
+    if isinstance(value, dict):
+        return (dict, tuple((k, _get_intern_key(v)) for k, v in value.items()))
+    if isinstance(value, set):
+        return (set, frozenset(value))
+    # Include the type so that e.g. 1, 1.0 and True are not mixed up
+    return (type(value), value)
+
+class _InternedRecordType(type):
+
+    def __call__(cls, *args, **kwargs):
+        return cls._intern(super().__call__(*args, **kwargs))
+
+    def _intern(cls, new: Any) -> Any:
+        parts: list[Any] = [ cls ]
+        for _k, v in get_schema(cls).get_fields(new):
+            parts.append((str, v) if type(v) is str else _get_intern_key(v))
+        key = tuple(parts)
+        try:
+            existing = _intern_table.get(key)
+        except TypeError:
+            # Some value can't be hashed, so this record stays unique
+            return new
+        if existing is not None:
+            return existing
+        _intern_table[key] = new
+        return new
+
+def _interned_equal(self, other: Any) -> bool:
+    return self is other
+
+def interned(cls: type[_Record]) -> type[_Record]:
+    """
+    A class decorator that makes a record immutable and shares instances
+    that have equal fields.
+
+    Constructing a record with the same field values as a live instance
+    returns that instance, so equality becomes an identity check and
+    duplicate subtrees take up memory only once. Interned records are
+    frozen, so their structural hash is computed once and cached. Instances
+    are kept in a table with weak references, so they are freed once they
+    are no longer used.
+
+    Fields must not be mutated after construction, so they should only hold
+    primitive values, tuples and other interned records. Like `@slotted`,
+    this creates a new class. Subclasses of an interned record are interned
+    as well.
+    """
+    ns = dict(cls.__dict__)
+    for name in ('__dict__', '__weakref__', _SCHEMA_ATTR_NAME) + _get_slots(cls):
+        ns.pop(name, None)
+    if _is_generated(ns.get('__init__')):
+        # The new class will generate its own constructor
+        del ns['__init__']
+    if '__slots__' in ns:
+        _add_cache_slots(ns, cls.__bases__)
+    ns[_FROZEN_ATTR_NAME] = True
+    ns['__setattr__'] = _frozen_setattr
+    ns['__eq__'] = _frozen_eq
+    ns['__hash__'] = _frozen_hash
+    ns['_equal'] = _interned_equal
+    ns['__qualname__'] = cls.__qualname__
+    new_cls = _InternedRecordType(cls.__name__, cls.__bases__, ns)
+    for value in ns.values():
+        _rebind_class_cells(value, cls, new_cls)
+    return cast(type[_Record], new_cls)
+
 def _coerce_to_record(value: Any, ty: type[_Record]) -> _Record:
-    hints = typing.get_type_hints(ty)
-    defaults = get_defaults(ty)
-    required = 0
-    for key in hints.keys():
-        if key not in defaults:
-            required += 1
+    required = len(get_schema(ty).required)
     if required == 0:
         if value is not None:
             raise CoercionError(f'could not coerce {value} to {ty} because all fields are optional')
@@ -1,7 +1,13 @@
 
-from typing import Any, Callable, Optional, Protocol, TypeVar, overload
+from concurrent.futures import ProcessPoolExecutor as _ProcessPoolExecutor
+import heapq as _heapq
+import multiprocessing as _multiprocessing
+import operator as _operator
+import os as _os
+import pickle as _pickle
+from typing import Any, Callable, Generic, Iterable, Optional, Protocol, TypeVar, overload
 
-from .common import PathLike, swap, lift
+from .common import PathLike, get, lift, parse_path, swap
 
 K = TypeVar('K')
 
@@ -13,11 +19,64 @@ foo: Comparable = int(1)
 T = TypeVar('T', bound=Comparable)
 Tc = TypeVar('Tc', bound=Comparable, contravariant=True)
 
+# Elements only need to be comparable if no key is given
+E = TypeVar('E')
+
 CompareFn = Callable[[T, T], bool]
 
+type KeyFn = Callable[[Any], Any]
+
+type KeyLike = PathLike | KeyFn
+
 def _default_cmp(a: T, b: T) -> bool:
     return a < b
 
+def _make_key_fn(key: KeyLike) -> KeyFn:
+    if callable(key):
+        return key
+    path = parse_path(key) if isinstance(key, str) else key
+    return lambda element: get(element, path)
+
+def _get_keys(elements: Iterable[Any], key: KeyLike) -> list[Any]:
+    # Resolve the key of every element exactly once
+    if callable(key):
+        return [ key(element) for element in elements ]
+    if isinstance(key, str):
+        key = parse_path(key)
+    return [ get(element, key) for element in elements ]
+
+def _sort_by_keys(a: list[T], key: KeyLike, cmp: CompareFn, sort: Callable[[list[int], CompareFn], None], low: int = 0, high: int | None = None) -> None:
+    # Sort the positions in [low, high) by their precomputed keys using
+    # `sort` and then put the elements in that order
+    if high is None:
+        high = len(a)
+    keys = _get_keys(a[low:high], key)
+    order = list(range(len(keys)))
+    sort(order, lambda i, j: cmp(keys[i], keys[j]))
+    a[low:high] = [ a[low+i] for i in order ]
+
+def cmp_to_key(cmp: CompareFn) -> KeyFn:
+    """
+    Turn a comparison function that returns whether its first argument is
+    less than its second argument into a key function.
+
+    The result can be passed as `key` to the functions in this module or to
+    the built-in `sorted()`, which then runs the comparisons without any
+    other layers of indirection.
+    """
+    class Key:
+        __slots__ = ('value',)
+        def __init__(self, value: Any) -> None:
+            self.value = value
+        def __lt__(self, other: 'Key') -> bool:
+            return cmp(self.value, other.value)
+        def __eq__(self, other: object) -> bool:
+            if not isinstance(other, Key):
+                return NotImplemented
+            return not cmp(self.value, other.value) and not cmp(other.value, self.value)
+        __hash__ = None # type: ignore
+    return Key
+
 def isheap(arr: list[T], cmp: Optional[CompareFn] = None):
     if cmp is None:
         cmp = _default_cmp
@@ -45,6 +104,14 @@ def _sift_down(arr: list[T], n: int, max: int, cmp: CompareFn) -> None:
     swap(arr, n, biggest)
     n = biggest
 
+def _sift_up(arr: list[T], n: int, cmp: CompareFn) -> None:
+    while n > 0:
+        parent = n // 2
+        if not cmp(arr[parent], arr[n]):
+            return
+        swap(arr, parent, n)
+        n = parent
+
 def heapify(arr: list[T], *, cmp: Optional[CompareFn] = None) -> None:
     if cmp is None:
         cmp = _default_cmp
@@ -60,13 +127,15 @@ def heapinsert(arr: list[T], v: T, *, cmp: Optional[CompareFn] =None, key=None)
     if key is not None:
         cmp = lift(cmp, key)
     arr.append(v)
-    _sift_down(arr, 0, len(arr)-1, cmp)
+    _sift_up(arr, len(arr)-1, cmp)
 
-def sortheap(a: list[T], *, cmp: Optional[CompareFn] = None, key=None) -> None:
+def sortheap(a: list[T], *, cmp: Optional[CompareFn] = None, key: KeyLike | None = None) -> None:
     if cmp is None:
         cmp = _default_cmp
     if key is not None:
-        cmp = lift(cmp, key)
+        # The positions of a heap form a heap of their keys as well
+        _sort_by_keys(a, key, cmp, lambda order, cmp: sortheap(order, cmp=cmp))
+        return
     j = len(a) - 1
     while j > 0:
         swap(a, 0, j)
@@ -74,20 +143,21 @@ def sortheap(a: list[T], *, cmp: Optional[CompareFn] = None, key=None) -> None:
         j -= 1
 
 @overload
-def heapsort(a: list[T], *, cmp: CompareFn, key: PathLike | None = None) -> None: ...
+def heapsort(a: list[T], *, cmp: CompareFn, key: KeyLike | None = None) -> None: ...
 
 @overload
-def heapsort(a: list[Tc], *, key: PathLike | None = None) -> None: ...
+def heapsort(a: list[Tc], *, key: KeyLike | None = None) -> None: ...
 
-def heapsort(a: list[T], *, cmp: CompareFn | None = None, key: PathLike | None = None) -> None:
+def heapsort(a: list[T], *, cmp: CompareFn | None = None, key: KeyLike | None = None) -> None:
     if cmp is None:
         cmp = _default_cmp
     if key is not None:
-        cmp = lift(cmp, key)
+        _sort_by_keys(a, key, cmp, lambda order, cmp: heapsort(order, cmp=cmp))
+        return
     heapify(a, cmp=cmp)
     sortheap(a, cmp=cmp)
 
-def quicksort(arr: list[T], low: Optional[int] = None, high: Optional[int] = None, cmp: Optional[CompareFn] = None):
+def quicksort(arr: list[T], low: Optional[int] = None, high: Optional[int] = None, cmp: Optional[CompareFn] = None, key: KeyLike | None = None):
 
     if cmp is None:
         cmp = _default_cmp
@@ -95,6 +165,9 @@ def quicksort(arr: list[T], low: Optional[int] = None, high: Optional[int] = Non
         low = 0
     if high is None:
         high = len(arr)-1
+    if key is not None:
+        _sort_by_keys(arr, key, cmp, lambda order, cmp: quicksort(order, cmp=cmp), low, high+1)
+        return
 
     def partition(low, high):
         i = low-1
@@ -111,3 +184,503 @@ def quicksort(arr: list[T], low: Optional[int] = None, high: Optional[int] = Non
         quicksort(arr, low, pi-1, cmp=cmp)
         quicksort(arr, pi+1, high, cmp=cmp)
 
+# Runs shorter than this are extended with a binary insertion sort before
+# they are merged
+_MIN_MERGE = 32
+
+def _compute_min_run(n: int) -> int:
+    r = 0
+    while n >= _MIN_MERGE:
+        r |= n & 1
+        n >>= 1
+    return n + r
+
+def _binary_insertion_sort(keys: list, values: list | None, lo: int, hi: int, start: int, cmp: CompareFn) -> None:
+    # Elements in [lo, start) are already sorted
+    for i in range(start, hi):
+        k = keys[i]
+        left = lo
+        right = i
+        while left < right:
+            mid = (left + right) // 2
+            if cmp(k, keys[mid]):
+                right = mid
+            else:
+                left = mid + 1
+        if left < i:
+            # Shift [left, i) one position to the right within the run
+            keys[left+1:i+1] = keys[left:i]
+            keys[left] = k
+            if values is not None:
+                v = values[i]
+                values[left+1:i+1] = values[left:i]
+                values[left] = v
+
+def _count_run(keys: list, values: list | None, lo: int, hi: int, cmp: CompareFn) -> int:
+    # Find the length of the run that starts at `lo`, reversing it in place if
+    # it is descending. Only strictly descending runs are reversed so that
+    # the sort stays stable.
+    run_hi = lo + 1
+    if run_hi == hi:
+        return 1
+    if cmp(keys[run_hi], keys[lo]):
+        run_hi += 1
+        while run_hi < hi and cmp(keys[run_hi], keys[run_hi-1]):
+            run_hi += 1
+        keys[lo:run_hi] = keys[lo:run_hi][::-1]
+        if values is not None:
+            values[lo:run_hi] = values[lo:run_hi][::-1]
+    else:
+        run_hi += 1
+        while run_hi < hi and not cmp(keys[run_hi], keys[run_hi-1]):
+            run_hi += 1
+    return run_hi - lo
+
+def _merge(keys: list, values: list | None, lo: int, mid: int, hi: int, cmp: CompareFn) -> None:
+    # Merge the sorted ranges [lo, mid) and [mid, hi)
+    if not cmp(keys[mid], keys[mid-1]):
+        # Already in order
+        return
+    # Elements of the left run that are not greater than the first element
+    # of the right run are already in place
+    first = keys[mid]
+    left = lo
+    right = mid
+    while left < right:
+        m = (left + right) // 2
+        if cmp(first, keys[m]):
+            right = m
+        else:
+            left = m + 1
+    lo = left
+    left_keys = keys[lo:mid]
+    left_values = values[lo:mid] if values is not None else None
+    n = len(left_keys)
+    i = 0
+    j = mid
+    k = lo
+    if values is None:
+        while i < n and j < hi:
+            key_j = keys[j]
+            key_i = left_keys[i]
+            if cmp(key_j, key_i):
+                keys[k] = key_j
+                j += 1
+            else:
+                keys[k] = key_i
+                i += 1
+            k += 1
+    else:
+        assert(left_values is not None)
+        while i < n and j < hi:
+            key_j = keys[j]
+            key_i = left_keys[i]
+            if cmp(key_j, key_i):
+                keys[k] = key_j
+                values[k] = values[j]
+                j += 1
+            else:
+                keys[k] = key_i
+                values[k] = left_values[i]
+                i += 1
+            k += 1
+    if i < n:
+        keys[k:k+n-i] = left_keys[i:]
+        if values is not None:
+            values[k:k+n-i] = left_values[i:] # type: ignore
+
+def _merge_runs(keys: list, values: list | None, runs: list[tuple[int, int]], i: int, cmp: CompareFn) -> None:
+    base_1, len_1 = runs[i]
+    base_2, len_2 = runs[i+1]
+    _merge(keys, values, base_1, base_2, base_2 + len_2, cmp)
+    runs[i] = (base_1, len_1 + len_2)
+    del runs[i+1]
+
+def _merge_sort(keys: list, values: list | None, cmp: CompareFn) -> None:
+    # Sort `keys` and apply the same permutation to `values`
+    n = len(keys)
+    if n < 2:
+        return
+    min_run = _compute_min_run(n)
+    runs = list[tuple[int, int]]()
+    lo = 0
+    while lo < n:
+        run_len = _count_run(keys, values, lo, n, cmp)
+        if run_len < min_run:
+            forced = min(min_run, n - lo)
+            _binary_insertion_sort(keys, values, lo, lo + forced, lo + run_len, cmp)
+            run_len = forced
+        runs.append((lo, run_len))
+        lo += run_len
+        # Keep the lengths of the pending runs decreasing quickly so that
+        # merges stay balanced
+        while len(runs) > 1:
+            i = len(runs) - 2
+            if (i > 0 and runs[i-1][1] <= runs[i][1] + runs[i+1][1]) \
+                    or (i > 1 and runs[i-2][1] <= runs[i-1][1] + runs[i][1]):
+                if runs[i-1][1] < runs[i+1][1]:
+                    i -= 1
+            elif runs[i][1] > runs[i+1][1]:
+                break
+            _merge_runs(keys, values, runs, i, cmp)
+    while len(runs) > 1:
+        i = len(runs) - 2
+        if i > 0 and runs[i-1][1] < runs[i+1][1]:
+            i -= 1
+        _merge_runs(keys, values, runs, i, cmp)
+
+@overload
+def mergesort(a: list[E], *, key: KeyLike, cmp: CompareFn | None = None) -> None: ...
+
+@overload
+def mergesort(a: list[T], *, cmp: CompareFn, key: KeyLike | None = None) -> None: ...
+
+@overload
+def mergesort(a: list[Tc], *, key: KeyLike | None = None) -> None: ...
+
+def mergesort(a: list[Any], *, cmp: CompareFn | None = None, key: KeyLike | None = None) -> None:
+    """
+    Sort `a` in place without changing the order of equal elements.
+
+    This is a natural merge sort in the style of Timsort: runs that are
+    already sorted are detected and merged bottom-up without recursion, so
+    sorted and reversed input take linear time. `key` is resolved exactly
+    once for every element and `cmp` is then applied to the keys. Unlike
+    the other sorting functions, the elements are moved along with their
+    keys, so no index array is needed.
+    """
+    if cmp is None:
+        # Avoids a Python-level call for every comparison
+        cmp = _operator.lt
+    if key is None:
+        _merge_sort(a, None, cmp)
+        return
+    _merge_sort(_get_keys(a, key), a, cmp)
+
+# Lists shorter than this are not worth the overhead of starting processes
+PARALLEL_SORT_THRESHOLD = 100000
+
+def _sort_chunk(chunk: list[Any], start: int, key: KeyLike | None, cmp: CompareFn) -> list[tuple[Any, int]]:
+    # Sort one chunk and return the keys together with the positions of the
+    # elements in the original list
+    keys = chunk if key is None else _get_keys(chunk, key)
+    if cmp is _operator.lt:
+        # The built-in sort is stable as well and needs no Python-level
+        # comparisons
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        return [ (keys[i], start + i) for i in order ]
+    positions = list(range(start, start + len(chunk)))
+    _merge_sort(keys, positions, cmp)
+    return list(zip(keys, positions))
+
+def _is_picklable(value: Any) -> bool:
+    try:
+        _pickle.dumps(value)
+    except (_pickle.PicklingError, AttributeError, TypeError):
+        return False
+    return True
+
+@overload
+def parallel_sort(a: list[E], *, key: KeyLike, cmp: CompareFn | None = None, workers: int | None = None, threshold: int = PARALLEL_SORT_THRESHOLD) -> None: ...
+
+@overload
+def parallel_sort(a: list[T], *, cmp: CompareFn, workers: int | None = None, threshold: int = PARALLEL_SORT_THRESHOLD) -> None: ...
+
+@overload
+def parallel_sort(a: list[Tc], *, workers: int | None = None, threshold: int = PARALLEL_SORT_THRESHOLD) -> None: ...
+
+def parallel_sort(a: list[Any], *, cmp: CompareFn | None = None, key: KeyLike | None = None, workers: int | None = None, threshold: int = PARALLEL_SORT_THRESHOLD) -> None:
+    """
+    Sort `a` in place using several processes.
+
+    The list is split into one chunk per worker. Each worker resolves the
+    keys of its chunk and sorts it, with the built-in sort if `cmp` is not
+    given and with `mergesort()` otherwise. The sorted chunks are
+    then merged in this process with a heap. Like `mergesort()`, the sort
+    is stable.
+
+    Every worker only receives its own chunk, together with `key` and
+    `cmp`, and sends back the keys and the positions of the elements. All
+    of these are pickled, so the elements, `key` and `cmp` must be picklable.
+    If `key` or `cmp` is not, such as a lambda or a local function, the list
+    is sorted in this process instead. The same happens for lists with fewer
+    than `threshold` elements.
+    """
+    if cmp is None:
+        cmp = _operator.lt
+    if workers is None:
+        workers = _os.cpu_count() or 1
+    n = len(a)
+    if n < threshold or workers < 2 or not _is_picklable((key, cmp)):
+        mergesort(a, cmp=cmp, key=key)
+        return
+    chunk_size = -(-n // workers)
+    with _ProcessPoolExecutor(workers, mp_context=_multiprocessing.get_context()) as executor:
+        futures = [ executor.submit(_sort_chunk, a[start:start + chunk_size], start, key, cmp) for start in range(0, n, chunk_size) ]
+        runs = [ future.result() for future in futures ]
+    if cmp is _operator.lt:
+        merge_key = _operator.itemgetter(0)
+    else:
+        to_key = cmp_to_key(cmp)
+        merge_key = lambda entry: to_key(entry[0])
+    # heapq.merge() takes equal elements from earlier runs first, which keeps
+    # the sort stable
+    a[:] = [ a[pos] for _key, pos in _heapq.merge(*runs, key=merge_key) ]
+
+class Heap(Generic[E]):
+    """
+    A binary heap that pops its elements from smallest to largest.
+
+    Elements are compared by their `key` using `cmp`, which defaults to `<`.
+    The key of an element is resolved once when it is pushed. If the key of
+    an element that is in the heap changes, call `update()` to move it to
+    its new place.
+
+    Like a list managed by `heapq`, the heap may contain the same element
+    more than once and elements do not need to be hashable. Because of this,
+    `update()`, `remove()` and `in` have to search for the element in O(n)
+    time. Use a `PriorityQueue` if these operations need to be fast.
+    """
+
+    # Only a PriorityQueue keeps track of the position of every element
+    _track_positions = False
+
+    def __init__(self, elements: Iterable[E] = (), *, cmp: CompareFn | None = None, key: KeyLike | None = None) -> None:
+        self._cmp = _operator.lt if cmp is None else cmp
+        self._key_fn = None if key is None else _make_key_fn(key)
+        self._elements = list[E]()
+        self._keys = list[Any]()
+        self._positions = dict[E, int]() if self._track_positions else None
+        self._heapify((element, self._get_key(element)) for element in elements)
+
+    def _get_key(self, element: E) -> Any:
+        return element if self._key_fn is None else self._key_fn(element)
+
+    def _find(self, element: Any) -> int | None:
+        if self._positions is not None:
+            return self._positions.get(element)
+        try:
+            return self._elements.index(element)
+        except ValueError:
+            return None
+
+    def _heapify(self, entries: Iterable[tuple[E, Any]]) -> None:
+        # Add all entries at once and restore the heap bottom-up in O(n)
+        elements = self._elements
+        keys = self._keys
+        positions = self._positions
+        for element, key in entries:
+            if positions is not None:
+                pos = positions.get(element)
+                if pos is not None:
+                    keys[pos] = key
+                    continue
+                positions[element] = len(elements)
+            elements.append(element)
+            keys.append(key)
+        for i in reversed(range(len(elements) // 2)):
+            self._sift_down(i)
+
+    def _sift_up(self, pos: int) -> int:
+        elements = self._elements
+        keys = self._keys
+        positions = self._positions
+        cmp = self._cmp
+        element = elements[pos]
+        key = keys[pos]
+        # Move the parents down until the spot for `element` is found
+        while pos > 0:
+            parent = (pos - 1) >> 1
+            parent_key = keys[parent]
+            if not cmp(key, parent_key):
+                break
+            parent_element = elements[parent]
+            elements[pos] = parent_element
+            keys[pos] = parent_key
+            if positions is not None:
+                positions[parent_element] = pos
+            pos = parent
+        elements[pos] = element
+        keys[pos] = key
+        if positions is not None:
+            positions[element] = pos
+        return pos
+
+    def _sift_down(self, pos: int) -> int:
+        elements = self._elements
+        keys = self._keys
+        positions = self._positions
+        cmp = self._cmp
+        n = len(elements)
+        element = elements[pos]
+        key = keys[pos]
+        # Move the smallest child up until the spot for `element` is found
+        while True:
+            child = 2 * pos + 1
+            if child >= n:
+                break
+            right = child + 1
+            if right < n and cmp(keys[right], keys[child]):
+                child = right
+            child_key = keys[child]
+            if not cmp(child_key, key):
+                break
+            child_element = elements[child]
+            elements[pos] = child_element
+            keys[pos] = child_key
+            if positions is not None:
+                positions[child_element] = pos
+            pos = child
+        elements[pos] = element
+        keys[pos] = key
+        if positions is not None:
+            positions[element] = pos
+        return pos
+
+    def _append(self, element: E, key: Any) -> None:
+        if self._positions is not None:
+            self._positions[element] = len(self._elements)
+        self._elements.append(element)
+        self._keys.append(key)
+        self._sift_up(len(self._elements) - 1)
+
+    def _set_key_at(self, pos: int, key: Any) -> None:
+        old_key = self._keys[pos]
+        self._keys[pos] = key
+        if self._cmp(key, old_key):
+            self._sift_up(pos)
+        else:
+            self._sift_down(pos)
+
+    def _remove_at(self, pos: int) -> E:
+        elements = self._elements
+        keys = self._keys
+        element = elements[pos]
+        if self._positions is not None:
+            del self._positions[element]
+        last_element = elements.pop()
+        last_key = keys.pop()
+        if pos < len(elements):
+            elements[pos] = last_element
+            keys[pos] = last_key
+            if self._positions is not None:
+                self._positions[last_element] = pos
+            self._sift_up(self._sift_down(pos))
+        return element
+
+    def _replace(self, element: E, key: Any) -> E:
+        if not self._elements:
+            raise IndexError('replace in an empty heap')
+        if self._positions is not None and element in self._positions:
+            result = self._remove_at(0)
+            self._set_key_at(self._positions[element], key)
+            return result
+        result = self._elements[0]
+        if self._positions is not None:
+            del self._positions[result]
+            self._positions[element] = 0
+        self._elements[0] = element
+        self._keys[0] = key
+        self._sift_down(0)
+        return result
+
+    def push(self, element: E) -> None:
+        """
+        Add `element` to the heap in O(log n) time.
+        """
+        self._append(element, self._get_key(element))
+
+    def pop(self) -> E:
+        """
+        Remove and return the smallest element in O(log n) time.
+        """
+        if not self._elements:
+            raise IndexError('pop from an empty heap')
+        return self._remove_at(0)
+
+    def peek(self) -> E:
+        """
+        Return the smallest element without removing it.
+        """
+        if not self._elements:
+            raise IndexError('peek into an empty heap')
+        return self._elements[0]
+
+    def replace(self, element: E) -> E:
+        """
+        Remove and return the smallest element and push `element`.
+
+        This is faster than a `pop()` followed by a `push()`.
+        """
+        return self._replace(element, self._get_key(element))
+
+    def update(self, element: E) -> None:
+        """
+        Move `element` to its new place after its key changed.
+        """
+        pos = self._find(element)
+        if pos is None:
+            raise KeyError(f'{element} is not in the heap')
+        self._set_key_at(pos, self._get_key(element))
+
+    def remove(self, element: E) -> None:
+        """
+        Remove one occurrence of `element` from the heap.
+        """
+        pos = self._find(element)
+        if pos is None:
+            raise KeyError(f'{element} is not in the heap')
+        self._remove_at(pos)
+
+    def __contains__(self, element: Any) -> bool:
+        return self._find(element) is not None
+
+    def __len__(self) -> int:
+        return len(self._elements)
+
+    def __bool__(self) -> bool:
+        return len(self._elements) > 0
+
+class PriorityQueue(Heap[E]):
+    """
+    A heap where each element has a priority that is given explicitly.
+
+    Elements are popped from lowest to highest priority. The queue keeps track
+    of the position of every element, so elements must be hashable and can
+    only be in the queue once. Pushing an element that is already in the
+    queue changes its priority in O(log n) time, which makes this suitable for
+    algorithms that need a decrease-key operation.
+    """
+
+    _track_positions = True
+
+    def __init__(self, elements: Iterable[tuple[E, Any]] = (), *, cmp: CompareFn | None = None) -> None:
+        super().__init__(cmp=cmp)
+        self._heapify(elements)
+
+    def push(self, element: E, priority: Any) -> None: # type: ignore[override]
+        """
+        Add `element` with the given priority or change its priority if it is
+        already in the queue.
+        """
+        pos = self._find(element)
+        if pos is None:
+            self._append(element, priority)
+        else:
+            self._set_key_at(pos, priority)
+
+    def replace(self, element: E, priority: Any) -> E: # type: ignore[override]
+        """
+        Remove and return the element with the lowest priority and push
+        `element` with the given priority.
+        """
+        return self._replace(element, priority)
+
+    def update(self, element: E) -> None:
+        raise TypeError(f'use push() to change the priority of an element in a PriorityQueue')
+
+    def get_priority(self, element: E) -> Any:
+        pos = self._find(element)
+        if pos is None:
+            raise KeyError(f'{element} is not in the queue')
+        return self._keys[pos]
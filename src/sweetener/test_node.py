@@ -1,9 +1,13 @@
 
-from typing import List
+import collections.abc
+import sys
+import pytest
+from typing import Callable, List
 
 from sweetener.util import nonnull
 
 from .node import *
+from .record import get_schema, slotted
 
 def test_preorder():
     assert(list(v for v in preorder([1,2,[3,4,[5]],6]) if isinstance(v, int)) == [1,2,3,4,5,6])
@@ -195,3 +199,233 @@ def test_get_full_path():
     assert(p[2] == 'children')
     assert(p[3] == 0)
 
+
+@slotted
+class SlottedNode(BaseNode):
+    pass
+
+@slotted
+class SlottedNAry(SlottedNode):
+    children: list[SlottedNode]
+
+@slotted
+class SlottedLeaf(SlottedNode):
+    value: int
+
+def test_slotted_node_navigation():
+
+    n0 = SlottedLeaf(0)
+    n1 = SlottedLeaf(1)
+    n2 = SlottedLeaf(2)
+    root = SlottedNAry([ n0, n1, n2 ])
+
+    set_parent_nodes(root)
+
+    assert(not hasattr(n0, '__dict__'))
+    assert(n1.parent is root)
+    assert(n1.prev_sibling is n0)
+    assert(n1.next_sibling is n2)
+    assert(n2.get_full_path() == [ 'children', 2 ])
+
+def test_insert_before_after():
+
+    n0 = Leaf(0)
+    n1 = Leaf(1)
+    n2 = Leaf(2)
+    root = NAry([ n0, n2 ])
+
+    set_parent_nodes(root)
+
+    n2.insert_before(n1)
+    n3 = Leaf(3)
+    n2.insert_after(n3)
+    n4 = Leaf(4)
+    n0.insert_before(n4)
+
+    assert(root.children == [ n4, n0, n1, n2, n3 ])
+    assert(root.first_child is n4)
+    assert(root.last_child is n3)
+    assert(n4.next_sibling is n0)
+    assert(n0.next_sibling is n1)
+    assert(n1.prev_sibling is n0)
+    assert(n1.next_sibling is n2)
+    assert(n2.next_sibling is n3)
+    assert(n3.prev_sibling is n2)
+    assert(n3.next_sibling is None)
+
+    assert_invariants(root)
+
+def test_insert_next_to_root_fails():
+
+    root = Leaf(0)
+
+    with pytest.raises(RuntimeError):
+        root.insert_after(Leaf(1))
+
+def test_replace_with_updates_siblings():
+
+    n0 = Leaf(0)
+    n1 = Leaf(1)
+    n2 = Leaf(2)
+    root = NAry([ n0, n1, n2 ])
+
+    set_parent_nodes(root)
+
+    n3 = NAry([ Leaf(4) ])
+    n1.replace_with(n3)
+    assert(root.children[1] is n3)
+    assert(n0.next_sibling is n3)
+    assert(n2.prev_sibling is n3)
+    assert(n3.prev_sibling is n0)
+    assert(n3.next_sibling is n2)
+    assert(n1.parent is None)
+
+    n5 = Leaf(5)
+    n2.replace_with(n5)
+    assert(root.last_child is n5)
+    assert(n5.prev_sibling is n3)
+
+    assert_invariants(root)
+
+def test_remove_first_and_last_child():
+
+    n0 = Leaf(0)
+    n1 = Leaf(1)
+    n2 = Leaf(2)
+    root = NAry([ n0, n1, n2 ])
+
+    set_parent_nodes(root)
+
+    n0.remove()
+    n2.remove()
+    assert(root.first_child is n1)
+    assert(root.last_child is n1)
+    assert(n1.prev_sibling is None)
+    assert(n1.next_sibling is None)
+
+    assert_invariants(root)
+
+class Unary(Node):
+    operand: Node | None
+
+def test_set_parent_nodes_deep_tree():
+
+    depth = sys.getrecursionlimit() * 2
+    leaf = Leaf(0)
+    root = leaf
+    for _ in range(depth):
+        root = Unary(root)
+
+    set_parent_nodes(root)
+
+    assert(leaf.parent is not None)
+    assert(leaf.parent_path == [ 'operand' ])
+    assert(len(leaf.get_full_path()) == depth)
+
+def test_set_parent_nodes_nested_paths():
+
+    n00 = Leaf(0)
+    n11 = Leaf(1)
+    m = Matrix([ [ n00 ], [ Leaf(2), n11 ] ])
+
+    set_parent_nodes(m)
+
+    assert(n00.parent_path == [ 'elements', 0, 0 ])
+    assert(n11.parent_path == [ 'elements', 1, 1 ])
+    assert(n00.next_sibling is m.elements[1][0])
+    assert(n11.prev_sibling is m.elements[1][0])
+    assert_invariants(m)
+
+class Call(Node):
+    name: str
+    line: int
+    args: list[Node]
+    callee: Node | None = None
+
+def test_expand_nodes_skips_leaf_fields():
+    n = Call('f', 1, [ Leaf(1) ])
+    assert(get_schema(Call).child_fields == ('args', 'callee'))
+    assert([ key for key, _value in expand_nodes(n) ] == [ 'args', 'callee' ])
+    assert([ key for key, _value in expand(n) ] == [ 'name', 'line', 'args', 'callee' ])
+
+def test_child_fields_skip_callables():
+
+    class Hook(Node):
+        f: Callable[[int], int]
+        g: collections.abc.Callable[[], None]
+        h: collections.abc.Callable
+        body: Node
+
+    assert(get_schema(Hook).child_fields == ('body',))
+
+def test_postorder():
+    n0 = Leaf(0)
+    n1 = Leaf(1)
+    root = NAry([ n0, n1 ])
+    assert(list(v for v in postorder(root) if isinstance(v, BaseNode)) == [ n0, n1, root ])
+
+def test_breadthfirst():
+    n00 = Leaf(0)
+    n0 = NAry([ n00 ])
+    n1 = Leaf(1)
+    root = NAry([ n0, n1 ])
+    assert(list(v for v in breadthfirst(root) if isinstance(v, BaseNode)) == [ root, n0, n1, n00 ])
+
+def test_update_in_shares_subtrees():
+
+    n00 = Leaf(0)
+    n01 = Leaf(1)
+    n10 = Leaf(2)
+    n11 = Leaf(3)
+    m = Matrix([ [ n00, n01 ], [ n10, n11 ] ])
+    root = NAry([ m ])
+    set_parent_nodes(root)
+
+    new_leaf = Leaf(4)
+    new_root = root.update_in([ 'children', 0, 'elements', 1, 0 ], new_leaf)
+
+    new_m = new_root.children[0]
+    assert(isinstance(new_m, Matrix))
+    assert(new_m is not m)
+    assert(new_m.elements[0] is m.elements[0])
+    assert(new_m.elements[1] is not m.elements[1])
+    assert(new_m.elements[1][1] is n11)
+    assert(m.elements[1][0] is n10)
+
+    assert(new_root.parent is None)
+    assert(new_m.parent is new_root)
+    assert(new_m.parent_path == [ 'children', 0 ])
+    assert(new_leaf.parent is new_m)
+    assert(new_leaf.parent_path == [ 'elements', 1, 0 ])
+    assert(new_leaf.get_full_path() == [ 'children', 0, 'elements', 1, 0 ])
+    assert(new_leaf.next_sibling is n11)
+
+    # The old tree is left as it was
+    assert(n10.parent is m)
+    assert(n11.parent is m)
+    assert_invariants(root)
+
+    set_parent_nodes(new_root)
+    assert(n11.parent is new_m)
+    assert_invariants(new_root)
+
+def test_update_in_resets_siblings_of_new_value():
+
+    n00 = Leaf(0)
+    n01 = Leaf(1)
+    n10 = Leaf(2)
+    n11 = Leaf(3)
+    root = NAry([ Matrix([ [ n00, n01 ], [ n10, n11 ] ]) ])
+    set_parent_nodes(root)
+
+    a = Leaf(4)
+    b = Leaf(5)
+    c = Leaf(6)
+    other = NAry([ a, b, c ])
+    set_parent_nodes(other)
+    assert(b.prev_sibling is a)
+    assert(b.next_sibling is c)
+
+    root.update_in([ 'children', 0, 'elements', 1, 0 ], b)
+    assert(b.prev_sibling is n01)
+    assert(b.next_sibling is n11)
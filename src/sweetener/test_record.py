@@ -1,9 +1,11 @@
 
+import sys
 import pytest
 from typing import Optional
 
 from .compare import eq
-from .record import Record
+from .record import Record, ValidationLevel, interned, is_frozen, slotted, sort_key, structural_hash, get_schema, get_validation_level, invalidate_schema, set_validation_level, transform
+from .typing import CoercionError
 #from .visual import visualize
 
 def test_record_init_required():
@@ -69,3 +71,459 @@ def test_records_equal():
     r4 = SecondRecord(1, 'a')
     assert(not eq(r1, r4))
 
+
+def test_record_schema_cached():
+
+    class MyRecord(Record):
+        a: int
+        b: str = 'foo'
+
+    schema = get_schema(MyRecord)
+    assert(get_schema(MyRecord) is schema)
+    assert(schema.field_names == ('a', 'b'))
+    assert(schema.required == ('a',))
+    assert(schema.optional == ('b',))
+    assert(schema.defaults == { 'b': 'foo' })
+
+def test_record_schema_invalidate():
+
+    class Base(Record):
+        a: int
+
+    class Derived(Base):
+        b: int = 2
+
+    assert(get_schema(Derived).field_names == ('a', 'b'))
+
+    Base.__annotations__ = { 'a': int, 'c': str }
+    invalidate_schema(Base)
+
+    assert(get_schema(Base).field_names == ('a', 'c'))
+    assert(get_schema(Derived).field_names == ('a', 'c', 'b'))
+    r = Derived(1, 'foo')
+    assert(r.c == 'foo') # type: ignore[attr-defined]
+    assert(r.b == 2)
+
+def test_record_schema_annotations_changed_in_place():
+
+    class A(Record):
+        x: int
+
+    assert(A(1).x == 1)
+    A.__annotations__['y'] = str
+    assert(get_schema(A).field_names == ('x', 'y'))
+    a = A(1, 'q')
+    assert(a.y == 'q') # type: ignore[attr-defined]
+
+    class B(Record, compiled=True):
+        x: int
+
+    assert(B(1).x == 1)
+    B.__annotations__['y'] = str
+    invalidate_schema(B)
+    b = B(1, 'q')
+    assert(b.y == 'q') # type: ignore[attr-defined]
+
+def test_record_compiled_init():
+
+    class MyRecord(Record, compiled=True):
+        field_1: str
+        field_2: Optional[int]
+        field_3: float = 1.5
+        field_4: list[int] = []
+
+    r1 = MyRecord('a', 1)
+    assert(r1.field_1 == 'a')
+    assert(r1.field_2 == 1)
+    assert(r1.field_3 == 1.5)
+    assert(r1.field_4 == [])
+
+    r2 = MyRecord(field_2=2, field_1='b', field_4=[1, 2])
+    assert(r2.field_1 == 'b')
+    assert(r2.field_2 == 2)
+    assert(r2.field_4 == [1, 2])
+
+    r3 = MyRecord('c')
+    assert(r3.field_2 is None)
+    assert(r3.field_4 is not r1.field_4)
+
+    with pytest.raises(TypeError):
+        MyRecord()
+    with pytest.raises(TypeError):
+        MyRecord('a', 1, 2.5, [], 5)
+    with pytest.raises(TypeError):
+        MyRecord('a', 1, field_4=['foo'])
+    with pytest.raises(TypeError):
+        MyRecord('a', 1, foo=3)
+
+def test_record_compiled_init_inherited():
+
+    class Base(Record, compiled=True):
+        a: int
+
+        def __post_init__(self) -> None:
+            self.initialized = True
+
+    class Derived(Base):
+        b: float
+
+    class Generic(Base, compiled=False):
+        c: str
+
+    d = Derived(1, 2)
+    assert(d.a == 1)
+    assert(isinstance(d.b, float))
+    assert(d.initialized)
+    g = Generic(1, 'foo')
+    assert(g.c == 'foo')
+    assert(g.initialized)
+    assert(Generic.__init__ is Record.__init__)
+
+type _Tree = int | list[_Tree]
+
+def test_record_compiled_init_recursive_alias():
+
+    class MyRecord(Record, compiled=True):
+        tree: _Tree
+
+    assert(MyRecord([ 1, [ 2, [] ] ]).tree == [ 1, [ 2, [] ] ])
+    with pytest.raises(TypeError):
+        MyRecord([ 1, [ 'foo' ] ]) # type: ignore[arg-type]
+
+def test_record_compiled_init_shadowed_builtins():
+
+    class MyRecord(Record, compiled=True):
+        all: list[int]
+        isinstance: int | str
+        TypeError: list[int] = []
+
+    r = MyRecord([ 1, 2 ], 'foo')
+    assert(r.all == [ 1, 2 ])
+    assert(r.isinstance == 'foo')
+    with pytest.raises(TypeError):
+        MyRecord([ 1 ], 2, [ 'foo' ]) # type: ignore[arg-type]
+
+def test_record_compiled_init_rejects_custom_init():
+
+    with pytest.raises(TypeError):
+        class MyRecord(Record, compiled=True):
+            a: int
+            def __init__(self, a: int) -> None:
+                super().__init__(a)
+
+@pytest.mark.parametrize('compiled', [ False, True ])
+def test_record_validation_levels(compiled: bool):
+
+    class Deep(Record, compiled=compiled, validation=ValidationLevel.DEEP):
+        elements: list[int]
+
+    class Shallow(Record, compiled=compiled, validation=ValidationLevel.SHALLOW):
+        elements: list[int]
+
+    class Off(Record, compiled=compiled, validation=ValidationLevel.OFF):
+        elements: list[int]
+
+    with pytest.raises(CoercionError):
+        Deep([ 'one' ])
+    d = Deep([ 1 ])
+    with pytest.raises(RuntimeError):
+        d.elements = [ 'one' ] # type: ignore[assignment]
+    with pytest.raises(RuntimeError):
+        d.fields['elements'] = [ 'one' ]
+
+    s = Shallow([ 'one' ])
+    assert(s.elements == [ 'one' ])
+    s.elements = [ 'two' ] # type: ignore[assignment]
+    with pytest.raises(RuntimeError):
+        s.elements = 'one' # type: ignore[assignment]
+    with pytest.raises(RuntimeError):
+        s.fields['elements'] = 'one'
+
+    o = Off('one')
+    assert(o.elements == 'one')
+    o.elements = 2 # type: ignore[assignment]
+    o.fields['elements'] = 3
+    assert(o.elements == 3)
+
+def test_record_validation_level_global():
+
+    class MyRecord(Record):
+        value: int
+
+    class Strict(MyRecord, validation=ValidationLevel.DEEP):
+        pass
+
+    assert(get_validation_level(MyRecord) == ValidationLevel.DEEP)
+    set_validation_level(ValidationLevel.OFF)
+    try:
+        assert(get_validation_level(MyRecord) == ValidationLevel.OFF)
+        r = MyRecord(1)
+        r.value = 'foo' # type: ignore[assignment]
+        assert(r.value == 'foo')
+        with pytest.raises(RuntimeError):
+            Strict(1).value = 'foo' # type: ignore[assignment]
+    finally:
+        set_validation_level(ValidationLevel.DEEP)
+    with pytest.raises(RuntimeError):
+        r.value = 'foo' # type: ignore[assignment]
+
+@pytest.mark.parametrize('compiled', [ False, True ])
+def test_record_slotted(compiled: bool):
+
+    @slotted
+    class Base(Record, compiled=compiled):
+        a: int
+
+    @slotted
+    class Derived(Base):
+        b: str = 'foo'
+        c: list[int] = []
+
+        def describe(self) -> str:
+            return f'{self.a} {self.b}'
+
+        def __repr__(self) -> str:
+            return super().__repr__()
+
+    r1 = Derived(1)
+    assert(not hasattr(r1, '__dict__'))
+    assert(r1.a == 1)
+    assert(r1.b == 'foo')
+    assert(r1.describe() == '1 foo')
+    repr(r1)
+    r2 = Derived(2, 'bar')
+    assert(r2.c is not r1.c)
+    assert(get_schema(Derived).defaults == { 'b': 'foo', 'c': [] })
+    assert(list(r2.fields.items()) == [ ('a', 2), ('b', 'bar'), ('c', []) ])
+    r2.a = 3
+    with pytest.raises(RuntimeError):
+        r2.a = 'bar' # type: ignore[assignment]
+    r3 = r2.clone()
+    assert(eq(r2, r3))
+    assert(r3.to_primitive() == { '$type': 'Derived', 'a': 3, 'b': 'bar', 'c': [] })
+
+def test_record_slotted_requires_slotted_bases():
+
+    class Base(Record):
+        a: int
+
+    with pytest.raises(TypeError):
+        @slotted
+        class Derived(Base):
+            b: str
+
+class _Leaf(Record):
+    value: int
+
+class _Wrap(Record):
+    inner: '_Wrap | _Leaf'
+    label: str
+
+def test_record_transform_identity():
+
+    def bump(value):
+        if isinstance(value, _Leaf):
+            return _Leaf(value.value + 1)
+        return value
+
+    node = _Leaf(0)
+    for i in range(sys.getrecursionlimit() * 2):
+        node = _Wrap(node, str(i))
+
+    result = transform(node, bump, identity=True)
+    assert(result is not node)
+    depth = 0
+    while isinstance(result, _Wrap):
+        result = result.inner
+        depth += 1
+    assert(depth == sys.getrecursionlimit() * 2)
+    assert(result.value == 1)
+
+    # An equal copy still counts as a change when comparing by identity
+    tree = _Wrap(_Leaf(1), 'a')
+    copy = lambda value: list(value) if isinstance(value, list) else value
+    items = [ tree, [ 1, 2 ] ]
+    assert(transform(items, copy) is items)
+    new_items = transform(items, copy, identity=True)
+    assert(new_items is not items)
+    assert(new_items == items)
+
+    assert(transform(tree, lambda value: value, identity=True) is tree)
+
+class _Point(Record):
+    x: int
+    y: int
+    tags: list[str] = []
+
+def test_record_replace():
+    p = _Point(1, 2, [ 'a' ])
+    q = p.replace(y=3)
+    assert(q is not p)
+    assert(q.x == 1)
+    assert(q.y == 3)
+    assert(q.tags is p.tags)
+    assert(p.y == 2)
+    with pytest.raises(TypeError):
+        p.replace(z=1)
+    with pytest.raises(TypeError):
+        p.replace(tags=1)
+
+def test_record_update_in():
+    tree = _Wrap(_Wrap(_Leaf(1), 'b'), 'a')
+    new_tree = tree.update_in([ 'inner', 'inner', 'value' ], 5)
+    assert(new_tree.inner.inner.value == 5) # type: ignore[union-attr]
+    assert(tree.inner.inner.value == 1) # type: ignore[union-attr]
+    assert(new_tree.inner is not tree.inner)
+    assert(new_tree.label == 'a')
+    assert(tree.update_in([ 'inner', 'label' ], 'b') is tree)
+    holder = _Wrap(_Leaf(0), 'x')
+    holder.inner = _Wrap(_Leaf(0), 'y')
+    new_holder = holder.update_in([ 'inner', 'label' ], 'z')
+    assert(new_holder.inner.label == 'z') # type: ignore[union-attr]
+    assert(new_holder.inner.inner is holder.inner.inner) # type: ignore[union-attr]
+
+def test_records_equal_nested():
+    assert(eq(_Wrap(_Leaf(1), 'a'), _Wrap(_Leaf(1), 'a')))
+    assert(not eq(_Wrap(_Leaf(1), 'a'), _Wrap(_Leaf(2), 'a')))
+
+@pytest.mark.parametrize('slots', [ False, True ])
+def test_record_interned(slots: bool):
+
+    class Expr(Record):
+        __slots__ = ()
+
+    class Lit(Expr):
+        value: int | bool
+
+    class Pair(Expr):
+        left: Expr
+        right: Expr
+        tags: tuple[str, ...] = ()
+
+    if slots:
+        Lit = slotted(Lit)
+        Pair = slotted(Pair)
+    Lit = interned(Lit)
+    Pair = interned(Pair)
+
+    a = Pair(Lit(1), Lit(2), ('x',))
+    b = Pair(Lit(1), Lit(2), ('x',))
+    assert(a is b)
+    assert(a.left is b.left)
+    assert(Lit(1) is not Lit(True))
+    assert(Pair(Lit(1), Lit(2)) is not a)
+    assert(hash(a) == hash(b))
+    assert(eq(a, b))
+    assert(a.replace(left=Lit(3)) is Pair(Lit(3), Lit(2), ('x',)))
+    assert(a.clone() is a)
+    with pytest.raises(RuntimeError):
+        a.left = Lit(3)
+
+@pytest.mark.parametrize('slots', [ False, True ])
+def test_record_frozen(slots: bool):
+
+    class Expr(Record, frozen=True):
+        __slots__ = ()
+
+    class Lit(Expr):
+        value: int
+
+    class Pair(Expr):
+        left: Expr
+        right: Expr
+
+    if slots:
+        Lit = slotted(Lit)
+        Pair = slotted(Pair)
+
+    a = Pair(Lit(1), Pair(Lit(2), Lit(3)))
+    b = Pair(Lit(1), Pair(Lit(2), Lit(3)))
+    assert(is_frozen(a))
+    assert(a is not b)
+    assert(a == b)
+    assert(hash(a) == hash(b))
+    assert(a != Pair(Lit(1), Lit(2)))
+    assert({ a: 1 }[b] == 1)
+    with pytest.raises(RuntimeError):
+        a.left = Lit(2)
+
+    class Mutable(Lit, frozen=False):
+        pass
+
+    m = Mutable(1)
+    m.value = 2
+    assert(not is_frozen(m))
+    assert(m != Mutable(2))
+
+def test_structural_hash():
+    assert(structural_hash(_Wrap(_Leaf(1), 'a')) == structural_hash(_Wrap(_Leaf(1), 'a')))
+    assert(structural_hash([ 1, 2 ]) != structural_hash((1, 2)))
+    assert(structural_hash({ 'a': [ 1 ] }) == structural_hash({ 'a': [ 1 ] }))
+
+def test_eq_deep():
+    a = _Leaf(0)
+    b = _Leaf(0)
+    for i in range(sys.getrecursionlimit() * 2):
+        a = _Wrap(a, str(i))
+        b = _Wrap(b, str(i))
+    assert(eq(a, b))
+    assert(not eq(a, _Wrap(b, 'x')))
+    assert(eq([ a, { 'k': (a,) } ], [ b, { 'k': (b,) } ]))
+
+def test_record_sort_key():
+
+    class Item(Record):
+        name: str
+        tags: list[str]
+        extra: dict[str, int] | None = None
+
+    items = [
+        Item('b', [ 'x' ]),
+        Item('a', [ 'y', 'z' ]),
+        Item('a', [ 'y' ]),
+        Item('a', [ 'y' ], { 'k': 1 }),
+        Item('a', [ 'y' ], { 'j': 2 }),
+    ]
+    # Like dictionaries, the fields are compared in the order of their names
+    expected = [ items[2], items[1], items[0], items[4], items[3] ]
+    assert(sorted(items, key=sort_key) == expected)
+    assert(sorted(items) == expected)
+    for a in items:
+        for b in items:
+            assert((a < b) == (sort_key(a) < sort_key(b)))
+            assert(not (a < b and b < a))
+
+    assert(sort_key(None) < sort_key(False) < sort_key(0) < sort_key('') < sort_key(()) < sort_key([]) < sort_key({}) < sort_key(items[0]))
+    assert(sort_key({ 'a': 2 }) < sort_key({ 'b': 1 }))
+    assert(sort_key([ 1, 2 ]) < sort_key([ 1, 2, 0 ]))
+
+def test_record_sort_key_cached():
+
+    class Key(Record, frozen=True):
+        parts: tuple[int, ...]
+
+    k = Key((1, 2))
+    assert(sort_key(k) is sort_key(k))
+    assert(sort_key(k) == sort_key(Key((1, 2))))
+
+def test_record_sort_key_deep():
+
+    class Neg(Record):
+        operand: Record | int
+
+    depth = sys.getrecursionlimit() * 20
+    a = 1
+    b = 2
+    for _ in range(depth):
+        a = Neg(a)
+        b = Neg(b)
+    assert(isinstance(a, Neg) and isinstance(b, Neg))
+
+    # Comparing the keys does not recurse either
+    assert(sort_key(a) < sort_key(b))
+    assert(a < b)
+    assert(not (b < a))
+
+def test_record_sort_key_rejects_bytes():
+    with pytest.raises(TypeError):
+        sort_key(b'foo')
@@ -1,5 +1,8 @@
 
-from .sorting import isheap, isheap, heapsort, heapify
+import pytest
+import random
+
+from .sorting import Heap, PriorityQueue, cmp_to_key, parallel_sort, isheap, isheap, heapinsert, heapsort, heapify, mergesort, quicksort, sortheap
 
 def test_isheap_last_element_greater():
     l1 = [4,3,2,5]
@@ -58,3 +61,141 @@ def test_heapsort_random_list():
     assert(l[7] == 8)
     assert(l[8] == 9)
 
+
+def test_mergesort_inputs():
+    rng = random.Random(1)
+    for n in [ 0, 1, 2, 31, 32, 33, 100, 1000 ]:
+        inputs = [
+            [ rng.randrange(1000) for _ in range(n) ],
+            list(range(n)),
+            list(reversed(range(n))),
+            [ rng.randrange(3) for _ in range(n) ],
+        ]
+        for l in inputs:
+            expected = sorted(l)
+            mergesort(l)
+            assert(l == expected)
+
+def test_mergesort_stable_with_key():
+    l = [ { 'pos': { 'line': i % 5 }, 'id': i } for i in range(200) ]
+    mergesort(l, key='pos.line')
+    assert(l == sorted(l, key=lambda x: x['pos']['line']))
+
+def test_mergesort_cmp():
+    l = [ 3, 1, 2, 5, 4 ]
+    mergesort(l, cmp=lambda a, b: a > b)
+    assert(l == [ 5, 4, 3, 2, 1 ])
+
+def test_sort_key_resolved_once():
+
+    class Counted:
+        resolved = 0
+        def __init__(self, value: int) -> None:
+            self._value = value
+        @property
+        def value(self) -> int:
+            Counted.resolved += 1
+            return self._value
+
+    rng = random.Random(2)
+    for sort in [ heapsort, mergesort, quicksort ]:
+        l = [ { 'x': Counted(rng.randrange(50)) } for _ in range(100) ]
+        expected = sorted(l, key=lambda e: e['x']._value)
+        Counted.resolved = 0
+        sort(l, key='x.value')
+        assert(Counted.resolved == 100)
+        assert([ e['x']._value for e in l ] == [ e['x']._value for e in expected ])
+
+def test_sort_callable_key():
+    for sort in [ heapsort, mergesort, quicksort ]:
+        l = [ 'ccc', 'a', 'bb' ]
+        sort(l, key=len)
+        assert(l == [ 'a', 'bb', 'ccc' ])
+
+def test_quicksort_key_range():
+    l = [ 9, 3, 2, 1, 0 ]
+    quicksort(l, 1, 3, key=lambda x: x)
+    assert(l == [ 9, 1, 2, 3, 0 ])
+
+def test_cmp_to_key():
+    by_length = lambda a, b: len(a) < len(b)
+    l = [ 'ccc', 'a', 'bb', 'd' ]
+    assert(sorted(l, key=cmp_to_key(by_length)) == [ 'a', 'd', 'bb', 'ccc' ])
+    mergesort(l, key=cmp_to_key(by_length))
+    assert(l == [ 'a', 'd', 'bb', 'ccc' ])
+
+def test_heapinsert():
+    rng = random.Random(3)
+    l = []
+    for _ in range(50):
+        heapinsert(l, rng.randrange(100))
+        assert(isheap(l))
+
+def test_heap_push_pop():
+    rng = random.Random(4)
+    values = [ rng.randrange(1000) for _ in range(200) ]
+    h = Heap(values[:100])
+    for v in values[100:]:
+        h.push(v)
+    assert(len(h) == len(values))
+    result = []
+    while h:
+        result.append(h.pop())
+    assert(result == sorted(values))
+
+def test_heap_duplicates_and_unhashable():
+    h = Heap([ 1, 1, 1 ])
+    assert(len(h) == 3)
+    h.remove(1)
+    assert(len(h) == 2)
+    assert(1 in h)
+    d = Heap([ { 'x': 2 }, { 'x': 1 }, { 'x': 2 } ], key='x')
+    assert(len(d) == 3)
+    assert({ 'x': 1 } in d)
+    d.remove({ 'x': 2 })
+    assert([ d.pop(), d.pop() ] == [ { 'x': 1 }, { 'x': 2 } ])
+
+def test_heap_key_and_update():
+
+    class Task:
+        def __init__(self, name: str, cost: int) -> None:
+            self.name = name
+            self.cost = cost
+
+    a = Task('a', 3)
+    b = Task('b', 1)
+    c = Task('c', 2)
+    h = Heap([ a, b, c ], key='cost')
+    assert(h.peek() is b)
+    a.cost = 0
+    h.update(a)
+    assert(h.peek() is a)
+    h.remove(a)
+    assert(a not in h)
+    assert(h.replace(a) is b)
+    assert([ h.pop().name, h.pop().name ] == [ 'a', 'c' ])
+
+def test_priority_queue_decrease_key():
+    q = PriorityQueue[str]([ ('x', 5), ('y', 3), ('z', 4) ])
+    q.push('x', 1)
+    assert(q.get_priority('x') == 1)
+    assert(q.pop() == 'x')
+    assert(q.replace('w', 10) == 'y')
+    assert([ q.pop(), q.pop() ] == [ 'z', 'w' ])
+    with pytest.raises(IndexError):
+        q.pop()
+
+def test_parallel_sort():
+    rng = random.Random(5)
+    l = [ { 'pos': { 'line': rng.randrange(100) }, 'id': i } for i in range(2000) ]
+    expected = sorted(l, key=lambda x: x['pos']['line'])
+    parallel_sort(l, key='pos.line', workers=3, threshold=100)
+    assert(l == expected)
+    l = [ 3, 1, 2 ]
+    parallel_sort(l, workers=3)
+    assert(l == [ 1, 2, 3 ])
+
+def test_parallel_sort_unpicklable_key():
+    l = [ 3, 1, 2, 5, 4 ]
+    parallel_sort(l, key=lambda x: -x, workers=2, threshold=0)
+    assert(l == [ 5, 4, 3, 2, 1 ])
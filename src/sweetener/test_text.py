@@ -1,10 +1,12 @@
 
 import json
+import os
+import random
 from pathlib import Path
 import pytest
 import io
 
-from .text import LineIndex, write_excerpt
+from .text import DiagnosticRenderer, IndentWriter, LineIndex, LineIndexCache, MappedLineIndex, TextFile, write_excerpt
 
 def test_line_index_empty():
     idx = LineIndex('')
@@ -94,3 +96,274 @@ def test_except_foobar():
             with open(file, 'a') as f:
                 f.write(actual);
             raise RuntimeError(f"Test '{file.stem}' had no expected value. The current output has been saved as the expected output. Re-run pytest to let the tests pass.")
+
+@pytest.mark.parametrize('chunk_size', [ 1, 3, 7, 65536 ])
+def test_line_index_chunked(chunk_size: int):
+    text = ''.join(('x' * (i % 5)) + '\n' for i in range(50)) + 'end'
+    expected_lines = [ 1 + text.count('\n', 0, offset) for offset in range(len(text)) ]
+    # Resolve lines in an order that jumps back and forth
+    idx = LineIndex(text, chunk_size=chunk_size)
+    for offset in list(range(len(text)-1, 0, -7)) + list(range(len(text))):
+        assert(idx.get_line(offset) == expected_lines[offset])
+    idx = LineIndex(text, chunk_size=chunk_size)
+    line_starts = [ 0 ] + [ i+1 for i, ch in enumerate(text) if ch == '\n' ]
+    for line in range(1, 52):
+        assert(idx.get_offset(line) == line_starts[line-1])
+    assert(idx.count_lines() == 51)
+
+def test_text_file_from_path(tmp_path: Path):
+    text = 'foo\nbär €\n\n𝄞 baz\nend'
+    path = tmp_path / 'input.txt'
+    path.write_text(text, encoding='utf-8')
+    # A small chunk size makes sure that lines are joined across chunks
+    mapped = MappedLineIndex(path, chunk_size=2)
+    idx = LineIndex(text)
+    assert(len(mapped) == len(text))
+    assert(str(mapped) == text)
+    assert(mapped.count_lines() == idx.count_lines())
+    for offset in range(len(text)):
+        assert(mapped[offset] == text[offset])
+        assert(mapped.get_line(offset) == idx.get_line(offset))
+        assert(mapped.get_column(offset) == idx.get_column(offset))
+        byte_offset = len(text[:offset].encode('utf-8'))
+        assert(mapped.get_byte_offset(offset) == byte_offset)
+        assert(mapped.get_char_offset(byte_offset) == offset)
+    for line in range(1, idx.count_lines()+2):
+        assert(mapped.get_offset(line) == idx.get_offset(line))
+    assert(mapped[4:9] == 'bär €')
+    assert(mapped[-3:] == 'end')
+    with pytest.raises(RuntimeError):
+        mapped.get_line(len(text))
+    with TextFile.from_path(path) as file:
+        assert(file.name == str(path))
+        assert(file.get_line(text.index('𝄞')) == 4)
+    mapped.close()
+
+def test_text_file_from_empty_path(tmp_path: Path):
+    path = tmp_path / 'empty.txt'
+    path.write_bytes(b'')
+    with TextFile.from_path(path) as file:
+        assert(len(file.text) == 0)
+        assert(file.count_lines() == 1)
+        assert(file.get_line_offset(1) == 0)
+
+def test_excerpt_from_path(tmp_path: Path):
+    for file in test_cache_dir.iterdir():
+        if not file.is_file():
+            continue
+        text = read_file(file)
+        i1 = text.index('---\n')
+        i2 = text.index('---\n', i1 + 4)
+        start, end = json.loads(text[i1+4:i2])
+        path = tmp_path / file.name
+        path.write_text(text, encoding='utf-8')
+        expected = io.StringIO()
+        write_excerpt(expected, text, (start, end))
+        actual = io.StringIO()
+        with TextFile.from_path(path) as mapped:
+            write_excerpt(actual, mapped, (start, end))
+        assert(actual.getvalue() == expected.getvalue())
+
+def test_line_index_cache(tmp_path: Path):
+    text = 'foo\nbär €\n\n𝄞 baz\nend'
+    path = tmp_path / 'input.txt'
+    path.write_text(text, encoding='utf-8')
+    cache = LineIndexCache(tmp_path / 'cache')
+    cold = TextFile.from_path(path, cache=cache)
+    assert(len(list(cache.directory.glob('*.lines'))) == 1)
+    warm = TextFile.from_path(path, cache=cache)
+    from_str = TextFile(text, cache=cache)
+    assert(len(list(cache.directory.glob('*.lines'))) == 1)
+    idx = LineIndex(text)
+    for offset in range(len(text)):
+        assert(warm.get_line(offset) == idx.get_line(offset))
+        assert(warm.get_column(offset) == idx.get_column(offset))
+        assert(from_str.get_line(offset) == idx.get_line(offset))
+        assert(warm[offset] == cold[offset] == text[offset])
+    for line in range(1, idx.count_lines()+2):
+        assert(warm.get_line_offset(line) == idx.get_offset(line))
+        assert(from_str.get_line_offset(line) == idx.get_offset(line))
+    assert(isinstance(warm.text, MappedLineIndex))
+    assert(warm.text.get_byte_offset(len(text)) == len(text.encode('utf-8')))
+    cold.close()
+    warm.close()
+
+def test_text_file_close(tmp_path: Path):
+    text = 'foo\nbar\n'
+    path = tmp_path / 'input.txt'
+    path.write_text(text, encoding='utf-8')
+    cache = LineIndexCache(tmp_path / 'cache')
+    TextFile.from_path(path, cache=cache).close()
+    # The second file loads its line starts from the cache entry
+    with TextFile.from_path(path, cache=cache) as file:
+        assert(file.get_line(4) == 2)
+    with pytest.raises(ValueError):
+        file.get_line_offset(2)
+    with pytest.raises(ValueError):
+        file[0]
+
+def test_line_index_cache_ignores_corrupt_entries(tmp_path: Path):
+    cache = LineIndexCache(tmp_path)
+    text = 'foo\nbar\n'
+    TextFile(text, cache=cache)
+    for entry in tmp_path.glob('*.lines'):
+        entry.write_bytes(b'garbage')
+    assert(TextFile(text, cache=cache).get_line(4) == 2)
+
+def test_line_index_cache_evicts_least_recently_used(tmp_path: Path):
+    cache = LineIndexCache(tmp_path)
+    TextFile('a\n' * 10, cache=cache)
+    entry_size = next(tmp_path.glob('*.lines')).stat().st_size
+    # Room for two entries of about the same size
+    cache.max_size = entry_size * 2 + 100
+    texts = [ 'a\n' * 10, 'b\n' * 10, 'c\n' * 10 ]
+    TextFile(texts[1], cache=cache)
+    # File times may be too coarse to tell the entries apart
+    os.utime(cache._get_path(texts[0].encode('utf-8')), (1000, 1000))
+    os.utime(cache._get_path(texts[1].encode('utf-8')), (2000, 2000))
+    TextFile(texts[2], cache=cache)
+    assert(len(list(tmp_path.glob('*.lines'))) == 2)
+    assert(not cache._get_path(texts[0].encode('utf-8')).exists())
+    assert(cache._get_path(texts[2].encode('utf-8')).exists())
+    cache.clear()
+    assert(not list(tmp_path.glob('*.lines')))
+
+@pytest.mark.parametrize('chunk_size,cached', [ (1, False), (5, False), (65536, False), (65536, True) ])
+def test_line_index_apply_edit(chunk_size: int, cached: bool, tmp_path: Path):
+    rng = random.Random(chunk_size)
+    text = 'foo\nbar\n\nbaz\n'
+    idx = LineIndex(text, chunk_size=chunk_size, cache=LineIndexCache(tmp_path) if cached else None)
+    if cached:
+        # Appending after the indexed text must not use the cached line
+        # starts as-is
+        idx.apply_edit(len(text), len(text), 'x\ny')
+        text += 'x\ny'
+        assert(idx.get_line(len(text)-1) == 6)
+    for _ in range(200):
+        start = rng.randrange(len(text)+1)
+        end = rng.randrange(start, min(len(text), start+6)+1)
+        new_text = ''.join(rng.choice('ab\n') for _ in range(rng.randrange(5)))
+        idx.apply_edit(start, end, new_text)
+        text = text[:start] + new_text + text[end:]
+        expected = LineIndex(text)
+        assert(idx.text == text)
+        for offset in range(0, len(text), 3):
+            assert(idx.get_line(offset) == expected.get_line(offset))
+            assert(idx.get_column(offset) == expected.get_column(offset))
+        for line in range(1, expected.count_lines()+2):
+            assert(idx.get_offset(line) == expected.get_offset(line))
+        assert(idx.count_lines() == expected.count_lines())
+    with pytest.raises(RuntimeError):
+        idx.apply_edit(0, len(text)+1, '')
+
+def test_text_file_apply_edit_from_path(tmp_path: Path):
+    path = tmp_path / 'input.txt'
+    path.write_text('foo\nbär\nbaz\n', encoding='utf-8')
+    with TextFile.from_path(path) as file:
+        file.apply_edit(4, 7, 'one\ntwo')
+    # The edited text no longer depends on the file
+    assert(file.text == 'foo\none\ntwo\nbaz\n')
+    assert(file.count_lines() == 5)
+    assert(file.get_line(8) == 3)
+    assert(file.get_line_offset(4) == 12)
+    out = io.StringIO()
+    write_excerpt(out, file, (8, 10))
+    expected = io.StringIO()
+    write_excerpt(expected, 'foo\none\ntwo\nbaz\n', (8, 10))
+    assert(out.getvalue() == expected.getvalue())
+
+class CharIndentWriter:
+    """
+    Writes one character at a time, like IndentWriter used to.
+    """
+
+    def __init__(self, indentation: str):
+        self.output = io.StringIO()
+        self.at_blank_line = True
+        self.newline_count = 0
+        self.indent_level = 0
+        self.indentation = indentation
+
+    def write(self, text: str) -> None:
+        for ch in text:
+            if ch == '\n':
+                self.newline_count = self.newline_count + 1 if self.at_blank_line else 1
+                self.at_blank_line = True
+            elif self.at_blank_line and ch not in '\r\t ':
+                self.newline_count = 0
+                self.output.write(self.indentation * self.indent_level)
+                self.at_blank_line = False
+            self.output.write(ch)
+
+def test_indent_writer():
+    rng = random.Random(1)
+    # A backslash must not be taken as part of a regular expression
+    writer = IndentWriter(indentation='\\ ')
+    expected = CharIndentWriter('\\ ')
+    for _ in range(500):
+        text = ''.join(rng.choice([ 'a', 'b', ' ', '\t', '\r', '\n', '\n', '{}' ]) for _ in range(rng.randrange(10)))
+        writer.write(text)
+        expected.write(text)
+        assert(writer.newline_count == expected.newline_count)
+        assert(writer.at_blank_line == expected.at_blank_line)
+        level = max(0, writer.indent_level + rng.choice([ -1, 0, 1 ]))
+        writer.indent_level = level
+        expected.indent_level = level
+    assert(isinstance(writer.output, io.StringIO))
+    assert(writer.output.getvalue() == expected.output.getvalue())
+
+def test_indent_writer_trailing_lines():
+    writer = IndentWriter()
+    writer.write('foo {\n')
+    writer.indent()
+    writer.write('bar\nbaz\n')
+    writer.dedent()
+    writer.write('}')
+    writer.ensure_trailing_lines(2)
+    writer.write('\n')
+    writer.ensure_trailing_lines(2)
+    assert(isinstance(writer.output, io.StringIO))
+    assert(writer.output.getvalue() == 'foo {\n  bar\n  baz\n}\n\n\n')
+    assert(writer.newline_count == 3)
+
+def _gutter(line: int | None = None) -> str:
+    return '\x1b[30m\x1b[47m' + ('' if line is None else str(line)).rjust(2) + '\x1b[0m '
+
+def _underline(column: int, width: int, message: str | None = None) -> str:
+    return _gutter() + ' ' * (column-1) + '\x1b[31m' + '~' * width + '\x1b[0m' + ('' if message is None else ' ' + message) + '\n'
+
+def test_diagnostic_renderer():
+    text = 'foo bar\nbaz\nqux\n\none\ntwo\nthree\n'
+    renderer = DiagnosticRenderer(text, lines_pre=0, lines_post=0)
+    renderer.add((21, 24), 'last')
+    renderer.add((4, 11), 'spans two lines')
+    renderer.add((0, 3))
+    assert(len(renderer) == 3)
+    out = renderer.write(io.StringIO())
+    assert(out.getvalue() == (
+        _gutter(1) + 'foo bar\n'
+        + _underline(1, 3)
+        + _underline(5, 3)
+        + _gutter(2) + 'baz\n'
+        + _underline(1, 3, 'spans two lines')
+        + '\n'
+        + _gutter(6) + 'two\n'
+        + _underline(1, 3, 'last')
+    ))
+
+def test_diagnostic_renderer_merges_excerpts(tmp_path: Path):
+    text = ''.join(f'line {i}\n' for i in range(1, 21))
+    path = tmp_path / 'input.txt'
+    path.write_text(text, encoding='utf-8')
+    # Also works on a memory-mapped file
+    with TextFile.from_path(path) as mapped:
+        for file in [ TextFile(text), mapped ]:
+            renderer = DiagnosticRenderer(file, lines_pre=1, lines_post=1)
+            for line in [ 3, 5, 15 ]:
+                offset = file.get_line_offset(line)
+                renderer.add((offset, offset + 4))
+            renderer.add((len(text), len(text)), 'end of file')
+            lines = renderer.write(io.StringIO()).getvalue().split('\n')
+            numbered = [ line for line in lines if line.startswith('\x1b[30m\x1b[47m') and not line.startswith(_gutter()) ]
+            assert(numbered == [ _gutter(i) + f'line {i}' for i in [ 2, 3, 4, 5, 6, 14, 15, 16 ] ] + [ _gutter(20) + 'line 20', _gutter(21) ])
+            assert(lines.count('') == 3)
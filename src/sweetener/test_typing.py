@@ -1,7 +1,9 @@
 
 import pytest
 
-from sweetener.typing import CoercionError, coerce
+from typing import Optional, Tuple
+
+from sweetener.typing import CoercionError, _class_coercions, add_coercion, clear_coercion_cache, coerce, coercion_cache_info, compile_type_check, satisfies_type
 
 def test_coerce_union_str_int_to_int():
     foo: str | int = 1
@@ -87,3 +89,57 @@ def test_coerce_nested():
         'two': [ { 'x': 3.0, 'y': 4.0 } ],
         'three': [ { 'x': 5.0, 'y': 6.0 } ],
     })
+
+def test_satisfies_type_compiled():
+    assert(satisfies_type([ 1, 2 ], list[int]))
+    assert(not satisfies_type([ 1, 'two' ], list[int]))
+    assert(satisfies_type((1, 2), Optional[Tuple[int, int]])) # type: ignore[arg-type]
+    assert(satisfies_type(None, Optional[Tuple[int, int]])) # type: ignore[arg-type]
+    assert(not satisfies_type((1, 2, 3), Optional[Tuple[int, int]])) # type: ignore[arg-type]
+    assert(satisfies_type((1, 2, 3), tuple[int, ...]))
+    assert(not satisfies_type((1, 'two'), tuple[int, ...]))
+    assert(satisfies_type({ 'a': [ 1.0 ] }, dict[str, list[float]]))
+    assert(not satisfies_type({ 'a': [ 1 ] }, dict[str, list[float]]))
+
+def test_compile_type_check_cached():
+    assert(compile_type_check(list[int]) is compile_type_check(list[int]))
+
+type _Tree = int | list[_Tree]
+
+def test_satisfies_type_recursive_alias():
+    assert(satisfies_type([ 1, [ 2, [ 3 ] ] ], _Tree)) # type: ignore[arg-type]
+    assert(not satisfies_type([ 1, [ 'two' ] ], _Tree)) # type: ignore[arg-type]
+
+def test_coerce_optional_list():
+    assert(coerce([ 1, 2 ], Optional[list[float]]) == [ 1.0, 2.0 ]) # type: ignore[arg-type]
+    assert(coerce(None, Optional[list[float]]) is None) # type: ignore[arg-type]
+
+def test_coerce_cache_hits():
+    clear_coercion_cache()
+    coerce([ 1, 2, 3 ], list[float])
+    info = coercion_cache_info()
+    assert(info.misses == 2)
+    assert(info.hits == 2)
+    coerce([ 4, 5 ], list[float])
+    info = coercion_cache_info()
+    assert(info.misses == 2)
+    assert(info.hits == 5)
+
+def test_coerce_cache_invalidated_by_add_coercion():
+
+    class Celsius:
+        def __init__(self, degrees: float) -> None:
+            self.degrees = degrees
+
+    with pytest.raises(CoercionError):
+        coerce(1.5, Celsius)
+
+    add_coercion(Celsius, lambda value, ty: ty(value))
+    try:
+        c = coerce(1.5, Celsius)
+        assert(isinstance(c, Celsius))
+        assert(c.degrees == 1.5)
+    finally:
+        # Don't leave the coercion or the plans that use it to other tests
+        _class_coercions[:] = [ entry for entry in _class_coercions if entry[0] is not Celsius ]
+        clear_coercion_cache()
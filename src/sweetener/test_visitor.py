@@ -0,0 +1,109 @@
+
+import sys
+
+from .node import BaseNode
+from .visitor import Transformer, Visitor
+
+class CalcNode(BaseNode):
+    pass
+
+class Expr(CalcNode):
+    pass
+
+class Add(Expr):
+    left: Expr
+    right: Expr
+
+class Neg(Expr):
+    operand: Expr
+
+class Var(Expr):
+    name: str
+
+class Lit(Expr):
+    value: int
+
+class Block(CalcNode):
+    body: list[Expr]
+
+def test_visitor_dispatch_order():
+
+    events = []
+
+    class Tracer(Visitor):
+        def visit_Add(self, node: Add) -> None:
+            events.append('enter Add')
+        def leave_Add(self, node: Add) -> None:
+            events.append('leave Add')
+        def visit_Expr(self, node: Expr) -> None:
+            events.append(f'visit {node.__class__.__name__}')
+
+    Tracer().visit(Block([ Add(Lit(1), Var('x')), Lit(2) ]))
+
+    assert(events == [ 'enter Add', 'visit Lit', 'visit Var', 'leave Add', 'visit Lit' ])
+
+def test_visitor_skip_children():
+
+    visited = []
+
+    class Collector(Visitor):
+        def visit_Neg(self, node: Neg) -> bool:
+            return False
+        def visit_Lit(self, node: Lit) -> None:
+            visited.append(node.value)
+
+    Collector().visit(Add(Neg(Lit(1)), Lit(2)))
+
+    assert(visited == [ 2 ])
+
+def test_visitor_deep_tree():
+
+    class Counter(Visitor):
+        count = 0
+        def visit_Lit(self, node: Lit) -> None:
+            self.count += 1
+
+    node = Lit(0)
+    for _ in range(sys.getrecursionlimit() * 2):
+        node = Neg(node)
+
+    counter = Counter()
+    counter.visit(node)
+    assert(counter.count == 1)
+
+def test_transformer_shares_unchanged_subtrees():
+
+    class Rename(Transformer):
+        def visit_Var(self, node: Var) -> Expr:
+            return Var('y') if node.name == 'x' else node
+
+    unchanged = Add(Lit(1), Lit(2))
+    root = Block([ unchanged, Neg(Var('x')) ])
+    new_root = Rename().transform(root)
+
+    assert(new_root is not root)
+    assert(new_root.body[0] is unchanged)
+    new_neg = new_root.body[1]
+    old_neg = root.body[1]
+    assert(isinstance(new_neg, Neg) and isinstance(old_neg, Neg))
+    assert(isinstance(new_neg.operand, Var) and isinstance(old_neg.operand, Var))
+    assert(new_neg.operand.name == 'y')
+    assert(old_neg.operand.name == 'x')
+
+    assert(Rename().transform(unchanged) is unchanged)
+
+def test_transformer_leave():
+
+    class Fold(Transformer):
+        def leave_Add(self, node: Add) -> Expr:
+            if isinstance(node.left, Lit) and isinstance(node.right, Lit):
+                return Lit(node.left.value + node.right.value)
+            return node
+        def leave_Neg(self, node: Neg) -> Expr:
+            if isinstance(node.operand, Lit):
+                return Lit(-node.operand.value)
+            return node
+
+    result = Fold().transform(Add(Neg(Lit(1)), Add(Lit(2), Lit(3))))
+    assert(isinstance(result, Lit))
+    assert(result.value == 4)
@@ -1,7 +1,17 @@
-
+from array import array
+from bisect import bisect_right
+import hashlib as _hashlib
+from itertools import accumulate, islice
+import mmap as _mmap
+import os as _os
+import pathlib as _pathlib
 import re
 import io
-from typing import TextIO
+import struct as _struct
+import sys as _sys
+import tempfile as _tempfile
+from typing import Iterator, TextIO
+
 from colorama import Fore, Back, Style
 
 from .ansicodes import *
@@ -10,6 +20,14 @@ from .math import count_digits
 
 _re_whitespace = re.compile('[\n\r\t ]')
 
+# Matches the whitespace at the start of a line that is followed by
+# something else than whitespace
+_re_indentable = re.compile('^[\r\t ]*(?=[^\n\r\t ])', re.MULTILINE)
+
+# Finds a line that is blank or starts with whitespace, not counting the
+# empty line at the end of a text that ends with a newline
+_re_blank_line_start = re.compile('\n[\n\r\t ]')
+
 class IndentWriter:
 
     def __init__(self, out: TextIO | None = None, indentation='  '):
@@ -20,7 +38,6 @@ class IndentWriter:
         self.newline_count = 0
         self.indent_level = 0
         self.indentation = indentation
-        self._re_whitespace = re.compile('[\n\r\t ]')
 
     def indent(self):
         self.indent_level += 1
@@ -32,23 +49,74 @@ class IndentWriter:
         self.write('\n' * max(0, count - self.newline_count))
 
     def write(self, text: str) -> None:
-        for ch in text:
-            if ch == '\n':
-                self.newline_count = self.newline_count + 1 if self.at_blank_line else 1
-                self.at_blank_line = True
-            elif self.at_blank_line and not self._re_whitespace.match(ch):
-                self.newline_count = 0
-                self.output.write(self.indentation * self.indent_level)
-                self.at_blank_line = False
-            self.output.write(ch)
+        # Indentation is inserted in front of the first character on each
+        # line that is not whitespace. Rather than looking at every
+        # character in Python, all lines are indented with a single regular
+        # expression and the result is written at once.
+        if self.at_blank_line:
+            head = ''
+            tail = text
+        else:
+            k = text.find('\n') + 1
+            head = text[:k] if k > 0 else text
+            tail = text[k:] if k > 0 else ''
+        if tail:
+            indentation = self.indentation * self.indent_level
+            if tail[0] not in '\n\r\t ' and _re_blank_line_start.search(tail) is None:
+                # Every line starts with something else than whitespace, so
+                # the indentation goes right after each newline
+                if tail[-1] == '\n':
+                    tail = indentation + tail[:-1].replace('\n', '\n' + indentation) + '\n'
+                else:
+                    tail = indentation + tail.replace('\n', '\n' + indentation)
+            elif indentation:
+                tail = _re_indentable.sub('\\g<0>' + indentation.replace('\\', '\\\\'), tail)
+        self.output.write(head + tail)
+        # Compute the state after the last character of `text`
+        end = len(text.rstrip('\n\r\t '))
+        newlines = text.count('\n', end)
+        if end > 0:
+            self.newline_count = newlines
+            self.at_blank_line = newlines > 0
+        elif newlines > 0:
+            self.newline_count = (self.newline_count if self.at_blank_line else 0) + newlines
+            self.at_blank_line = True
 
 EOF = '\uFFFF'
 
+_re_newline = re.compile('\n')
+
 class LineIndex:
+    """
+    Maps offsets in a text to line numbers and back.
+
+    Line starts are found lazily in chunks of `chunk_size` characters, so a
+    lookup near the start of a huge text does not scan all of it. Lookups in
+    the part that has already been scanned take O(log n) time.
 
-    def __init__(self, text: str):
+    The text can be edited with `apply_edit()`, which patches the line starts
+    instead of scanning the text again.
+    """
+
+    def __init__(self, text: str, chunk_size: int = 65536, cache: 'LineIndexCache | None' = None):
         self.text = text
-        self.lines = list()
+        self.chunk_size = chunk_size
+        # Offsets where line 2, 3, ... start
+        self.lines: list[int] | LineStartArray = list[int]()
+        # Everything before this offset has been scanned for newlines
+        self._scanned = 0
+        # The line starts in `lines` from `_shift_index` onwards are
+        # `_shift_delta` characters too small. Moving all of them after every
+        # edit would take O(n) time, so they are only moved when an edit
+        # happens before them.
+        self._shift_index = 0
+        self._shift_delta = 0
+        if cache is not None:
+            # The whole text is indexed at once, so that the next time the
+            # same text is opened nothing has to be scanned
+            _byte_starts, char_starts, _length = cache.get_line_starts(text.encode('utf-8'))
+            self.lines = char_starts[1:]
+            self._scanned = len(text)
 
     def __iter__(self):
         return iter(self.text)
@@ -62,33 +130,76 @@ class LineIndex:
     def __str__(self):
         return self.text
 
+    def _scan(self, end_offset: int) -> None:
+        # Scan at least up to and including `end_offset`, but a whole chunk
+        # at a time
+        end_offset = min(max(end_offset + 1, self._scanned + self.chunk_size), len(self.text))
+        if end_offset <= self._scanned:
+            return
+        assert(isinstance(self.lines, list))
+        delta = self._shift_delta
+        self.lines.extend(match.end() - delta for match in _re_newline.finditer(self.text, self._scanned, end_offset))
+        self._scanned = end_offset
+
+    def _bisect(self, offset: int) -> int:
+        # Like bisect_right() on the line starts, taking into account that
+        # the line starts after `_shift_index` need to be shifted
+        k = self._shift_index
+        i = bisect_right(self.lines, offset, 0, k)
+        if i < k:
+            return i
+        return bisect_right(self.lines, offset - self._shift_delta, k)
+
+    def _shift(self, start: int, end: int, delta: int) -> None:
+        lines = self.lines
+        assert(isinstance(lines, list))
+        for i in range(start, end):
+            lines[i] += delta
+
+    def apply_edit(self, start: int, end: int, new_text: str) -> None:
+        """
+        Replace the characters from `start` up to but not including `end`
+        with `new_text`.
+
+        The line starts that were already found are updated in O(log n + k)
+        time, where k is the number of lines that were removed or added plus
+        the number of lines between this edit and the previous one.
+        """
+        if start < 0 or start > end or end > len(self.text):
+            raise RuntimeError(f'edit out of text bounds')
+        if not isinstance(self.lines, list):
+            # Line starts that were loaded from a cache are read-only
+            self.lines = list(self.lines)
+        if start < self._scanned:
+            # Make sure all newlines that are removed have been found
+            self._count_lines_until_offset(end-1)
+        self.text = self.text[:start] + new_text + self.text[end:]
+        if start >= self._scanned:
+            # None of the line starts that were found have changed
+            return
+        delta = len(new_text) - (end - start)
+        # The line starts in (start, end] are removed
+        i = self._bisect(start)
+        j = self._bisect(end)
+        # Move the start of the shifted line starts to `j`
+        k = self._shift_index
+        if k < j:
+            self._shift(k, j, self._shift_delta)
+        else:
+            self._shift(j, k, -self._shift_delta)
+        new_lines = [ start + match.end() for match in _re_newline.finditer(new_text) ]
+        self.lines[i:j] = new_lines
+        self._shift_index = i + len(new_lines)
+        self._shift_delta += delta
+        self._scanned += delta
+
     def _count_lines_until_offset(self, end_offset):
-        end_offset = min(end_offset, len(self.text)-1)
-        line = 1 if not self.lines else len(self.lines)+1
-        offset = 0 if line == 1 else self.lines[line-2]
-        while offset <= end_offset:
-            ch = self.text[offset]
-            offset += 1
-            if ch == '\n':
-                self.lines.append(offset)
-                line += 1
+        if end_offset >= self._scanned:
+            self._scan(end_offset)
 
     def _count_lines_until_line(self, end_line):
-        max_length = len(self.text)
-        line = 1 if not self.lines else len(self.lines)+1
-        offset = 0 if line == 1 else self.lines[line-2]
-        while line <= end_line:
-            if offset >= max_length:
-                if offset == max_length:
-                    return line+1
-                raise RuntimeError(f'line index out of bounds')
-            ch = self.text[offset]
-            offset += 1
-            if ch == '\n':
-                self.lines.append(offset)
-                line += 1
-                if line == end_line:
-                    break
+        while len(self.lines) < end_line - 1 and self._scanned < len(self.text):
+            self._scan(self._scanned)
 
     def get_offset(self, line):
         if line < 1:
@@ -100,6 +211,8 @@ class LineIndex:
             if line-2 == len(self.lines):
                 return len(self.text)
             raise RuntimeError(f'line index out of bounds')
+        if line-2 >= self._shift_index:
+            return self.lines[line-2] + self._shift_delta
         return self.lines[line-2]
 
     def get_column(self, offset):
@@ -111,21 +224,347 @@ class LineIndex:
         if offset >= len(self.text):
             raise RuntimeError(f'offset out of text bounds')
         self._count_lines_until_offset(offset)
-        for i, line_start_offset in enumerate(self.lines):
-            if line_start_offset > offset:
-                return i+1
-        return len(self.lines)+1
+        return self._bisect(offset) + 1
 
     def count_lines(self):
         self._count_lines_until_offset(len(self.text)-1)
         return len(self.lines)+1
 
+def _get_line_starts(lines: list[bytes] | list[str], start: int) -> Iterator[int]:
+    # The offsets right after each of `lines`, where each line was followed
+    # by a newline that was split off. Everything happens in C, which
+    # matters for files with millions of lines.
+    return islice(accumulate(map((1).__add__, map(len, lines)), initial=start), 1, None)
+
+# Line starts are kept in arrays, or in memoryviews of a cache entry, so they
+# can be written to a file as they are
+type LineStartArray = array[int] | memoryview[int]
+
+type LineStarts = tuple[LineStartArray, LineStartArray, int]
+
+def _build_line_starts(data: bytes | _mmap.mmap, chunk_size: int = 1024 * 1024) -> LineStarts:
+    # Find the byte offsets and character offsets where each line of the
+    # UTF-8 encoded `data` starts, together with the length of the text in
+    # characters. The data is processed in chunks of about `chunk_size`
+    # bytes that always end on a newline, so that no chunk splits a
+    # multi-byte character.
+    size = len(data)
+    byte_starts = array('Q', [ 0 ])
+    char_starts = array('Q', [ 0 ])
+    byte_base = 0
+    char_base = 0
+    while byte_base < size:
+        end = data.find(b'\n', min(byte_base + chunk_size, size) - 1)
+        end = size if end == -1 else end + 1
+        chunk = data[byte_base:end]
+        byte_parts = chunk.split(b'\n')
+        del byte_parts[-1]
+        byte_starts.extend(_get_line_starts(byte_parts, byte_base))
+        if chunk.isascii():
+            char_starts.extend(_get_line_starts(byte_parts, char_base))
+            char_length = len(chunk)
+        else:
+            decoded = chunk.decode('utf-8')
+            char_parts = decoded.split('\n')
+            del char_parts[-1]
+            char_starts.extend(_get_line_starts(char_parts, char_base))
+            char_length = len(decoded)
+        byte_base = end
+        char_base += char_length
+    return byte_starts, char_starts, char_base
+
+_CACHE_MAGIC = b'SWLI'
+_CACHE_VERSION = 1
+# magic, version, byte order, line count, length in characters
+_cache_header = _struct.Struct('=4sHHQQ')
+
+class LineIndexCache:
+    """
+    Stores the line starts of texts on disk, so that a text that is opened
+    again does not have to be scanned for newlines.
+
+    Entries are keyed by the SHA-256 hash and the size of the UTF-8 encoded
+    text. They are loaded by mapping the file in memory, so a hit costs about
+    as much as hashing the text.
+
+    When the files in `directory` take more than `max_size` bytes, the
+    entries that were used least recently are removed.
+    """
+
+    def __init__(self, directory: str | _os.PathLike[str], max_size: int = 256 * 1024 * 1024):
+        self.directory = _pathlib.Path(directory)
+        self.max_size = max_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _get_path(self, data: bytes | _mmap.mmap) -> _pathlib.Path:
+        return self.directory / f'{_hashlib.sha256(data).hexdigest()}-{len(data)}.lines'
+
+    def _load(self, path: _pathlib.Path) -> LineStarts | None:
+        try:
+            with open(path, 'rb') as f:
+                buffer = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if len(buffer) < _cache_header.size:
+            return None
+        magic, version, byte_order, line_count, length = _cache_header.unpack_from(buffer)
+        if magic != _CACHE_MAGIC \
+                or version != _CACHE_VERSION \
+                or byte_order != _get_byte_order() \
+                or len(buffer) != _cache_header.size + line_count * 16:
+            return None
+        starts = memoryview(buffer)[_cache_header.size:].cast('Q')
+        # Mark the entry as recently used
+        _os.utime(path)
+        return starts[:line_count], starts[line_count:], length
+
+    def _store(self, path: _pathlib.Path, starts: LineStarts) -> None:
+        byte_starts, char_starts, length = starts
+        assert(len(byte_starts) == len(char_starts))
+        fd, temp_path = _tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with _os.fdopen(fd, 'wb') as f:
+                f.write(_cache_header.pack(_CACHE_MAGIC, _CACHE_VERSION, _get_byte_order(), len(byte_starts), length))
+                f.write(byte_starts)
+                f.write(char_starts)
+            # Other processes never see a half-written entry
+            _os.replace(temp_path, path)
+        except BaseException:
+            _os.unlink(temp_path)
+            raise
+        self._evict(path)
+
+    def _evict(self, keep: _pathlib.Path) -> None:
+        entries = []
+        total_size = 0
+        for path in self.directory.glob('*.lines'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+            total_size += stat.st_size
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total_size -= size
+
+    def get_line_starts(self, data: bytes | _mmap.mmap, chunk_size: int = 1024 * 1024) -> LineStarts:
+        """
+        Get the byte offsets and character offsets where the lines of the
+        UTF-8 encoded `data` start, together with the length of the text in
+        characters.
+
+        The line starts are loaded from the cache if they are present and
+        computed and stored otherwise.
+        """
+        path = self._get_path(data)
+        starts = self._load(path)
+        if starts is None:
+            starts = _build_line_starts(data, chunk_size)
+            self._store(path, starts)
+        return starts
+
+    def clear(self) -> None:
+        for path in self.directory.glob('*.lines'):
+            path.unlink(missing_ok=True)
+
+def _get_byte_order() -> int:
+    # The entries are stored in native byte order
+    return 0 if _sys.byteorder == 'little' else 1
+
+class MappedLineIndex:
+    """
+    A read-only text that is backed by a memory-mapped UTF-8 file, together
+    with an index of its lines.
+
+    The start of every line is stored both as a byte offset and as a
+    character offset in a compact `array('Q')`. Indexing and slicing use
+    character offsets, like `str`, and only decode the lines that are
+    accessed.
+
+    The line starts are found in a single pass over chunks of about
+    `chunk_size` bytes when the object is created, unless they can be loaded
+    from `cache`.
+    """
+
+    def __init__(self, path: str | _os.PathLike[str], chunk_size: int = 1024 * 1024, cache: LineIndexCache | None = None):
+        with open(path, 'rb') as f:
+            size = _os.fstat(f.fileno()).st_size
+            # Empty files cannot be mapped
+            self._data = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ) if size > 0 else b''
+        self._size = size
+        if cache is None:
+            starts = _build_line_starts(self._data, chunk_size)
+        else:
+            starts = cache.get_line_starts(self._data, chunk_size)
+        self._byte_starts, self._char_starts, self._length = starts
+        # The line that was decoded last, because the characters of a line
+        # are often accessed one after the other
+        self._cached_start = 0
+        self._cached_end = 0
+        self._cached_line = ''
+
+    def close(self) -> None:
+        """
+        Unmap the file and release the line starts that were loaded from a
+        cache. The text can not be accessed afterwards.
+        """
+        for starts in (self._byte_starts, self._char_starts):
+            if isinstance(starts, memoryview):
+                starts.release()
+        if isinstance(self._data, _mmap.mmap):
+            self._data.close()
+
+    def _decode_line(self, line: int) -> str:
+        # Decode line `line` (counting from 1) and remember it for later
+        byte_start = self._byte_starts[line-1]
+        byte_end = self._byte_starts[line] if line < len(self._byte_starts) else self._size
+        self._cached_start = self._char_starts[line-1]
+        self._cached_line = self._data[byte_start:byte_end].decode('utf-8')
+        self._cached_end = self._cached_start + len(self._cached_line)
+        return self._cached_line
+
+    def get_byte_offset(self, offset: int) -> int:
+        """
+        Get the offset in bytes of the character at `offset`.
+        """
+        if offset < 0 or offset > self._length:
+            raise RuntimeError(f'offset out of text bounds')
+        line = bisect_right(self._char_starts, offset)
+        char_start = self._char_starts[line-1]
+        byte_start = self._byte_starts[line-1]
+        byte_end = self._byte_starts[line] if line < len(self._byte_starts) else self._size
+        char_end = self._char_starts[line] if line < len(self._char_starts) else self._length
+        if byte_end - byte_start == char_end - char_start:
+            # The line only contains ASCII characters
+            return byte_start + offset - char_start
+        text = self._decode_line(line)
+        return byte_start + len(text[:offset - char_start].encode('utf-8'))
+
+    def get_char_offset(self, byte_offset: int) -> int:
+        """
+        Get the character offset that corresponds to `byte_offset`.
+        """
+        if byte_offset < 0 or byte_offset > self._size:
+            raise RuntimeError(f'offset out of text bounds')
+        line = bisect_right(self._byte_starts, byte_offset)
+        byte_start = self._byte_starts[line-1]
+        return self._char_starts[line-1] + len(self._data[byte_start:byte_offset].decode('utf-8'))
+
+    def __iter__(self) -> Iterator[str]:
+        for line in range(1, len(self._byte_starts)+1):
+            yield from self._decode_line(line)
+
+    def __getitem__(self, key: int | slice) -> str:
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._length)
+            if step != 1:
+                return self[start:stop][::step] if step > 0 else self[stop+1:start+1][::step]
+            if start >= stop:
+                return ''
+            return self._data[self.get_byte_offset(start):self.get_byte_offset(stop)].decode('utf-8')
+        if key < 0:
+            key += self._length
+        if not (self._cached_start <= key < self._cached_end):
+            if key < 0 or key >= self._length:
+                raise IndexError(f'text index out of range')
+            self._decode_line(bisect_right(self._char_starts, key))
+        return self._cached_line[key - self._cached_start]
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __str__(self) -> str:
+        return self._data[:].decode('utf-8')
+
+    def get_offset(self, line: int) -> int:
+        if line < 1:
+            raise RuntimeError(f'line index out of bounds')
+        if line-1 >= len(self._char_starts):
+            if line-1 == len(self._char_starts):
+                return self._length
+            raise RuntimeError(f'line index out of bounds')
+        return self._char_starts[line-1]
+
+    def get_column(self, offset: int) -> int:
+        return offset - self.get_offset(self.get_line(offset)) + 1
+
+    def get_line(self, offset: int) -> int:
+        if offset == 0:
+            return 1
+        if offset >= self._length:
+            raise RuntimeError(f'offset out of text bounds')
+        return bisect_right(self._char_starts, offset)
+
+    def count_lines(self) -> int:
+        return len(self._char_starts)
+
+    def to_line_index(self) -> LineIndex:
+        """
+        Decode the entire text into a `LineIndex` that reuses the line starts
+        that were already found.
+        """
+        index = LineIndex(str(self))
+        # Copied, so that the index outlives this object
+        index.lines = self._char_starts[1:].tolist()
+        index._scanned = self._length
+        return index
+
 class TextFile:
 
-    def __init__(self, text='', name: str | None = None):
+    def __init__(self, text: 'str | MappedLineIndex' = '', name: str | None = None, cache: LineIndexCache | None = None):
         self.text = text
         self.name = name
-        self._line_index = LineIndex(text)
+        self._line_index = text if isinstance(text, MappedLineIndex) else LineIndex(text, cache=cache)
+        # Kept after apply_edit() so that close() can still unmap the file
+        self._mapped = text if isinstance(text, MappedLineIndex) else None
+
+    @classmethod
+    def from_path(cls, path: str | _os.PathLike[str], name: str | None = None, cache: LineIndexCache | None = None) -> 'TextFile':
+        """
+        Open the UTF-8 encoded file at `path` without reading all of it into
+        memory.
+
+        The `text` of the result is a `MappedLineIndex`, which supports
+        indexing, slicing and `str()` like a normal string. Call `close()` or
+        use the result in a `with` statement to unmap the file.
+        """
+        if name is None:
+            name = _os.fspath(path)
+        return cls(MappedLineIndex(path, cache=cache), name)
+
+    def apply_edit(self, start: int, end: int, new_text: str) -> None:
+        """
+        Replace the characters from `start` up to but not including `end`
+        with `new_text`, keeping the line information that was computed.
+
+        A file that was opened with `from_path()` is read into memory first.
+        """
+        if isinstance(self._line_index, MappedLineIndex):
+            self._line_index = self._line_index.to_line_index()
+        self._line_index.apply_edit(start, end, new_text)
+        self.text = self._line_index.text
+
+    def close(self) -> None:
+        """
+        Unmap the file if this object was created with `from_path()`.
+        """
+        if self._mapped is not None:
+            self._mapped.close()
+
+    def __enter__(self) -> 'TextFile':
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
 
     def get_line_offset(self, line):
         return self._line_index.get_offset(line)
@@ -236,3 +675,109 @@ def write_excerpt(
 
     return out
 
+
+class DiagnosticRenderer:
+    """
+    Writes excerpts for many spans in the same text at once.
+
+    All spans share one `TextFile` and thus one line index. The spans are
+    sorted and the excerpts of spans that are close to each other are merged,
+    so every line of the text is printed at most once. Each line of an
+    excerpt is written as a single string.
+    """
+
+    def __init__(
+        self,
+        text: TextFile | str,
+        lines_pre: int = 1,
+        lines_post: int = 1,
+    ):
+        if not isinstance(text, TextFile):
+            text = TextFile(text)
+        self.file = text
+        self.lines_pre = lines_pre
+        self.lines_post = lines_post
+        self._diagnostics = list[tuple[int, int, str | None]]()
+
+    def add(self, span: tuple[int, int], message: str | None = None) -> None:
+        """
+        Underline the characters from `span[0]` up to but not including
+        `span[1]`, optionally followed by `message`.
+        """
+        start, end = span
+        if start < 0 or start > end or end > len(self.file.text):
+            raise RuntimeError(f'span out of text bounds')
+        self._diagnostics.append((start, end, message))
+
+    def __len__(self) -> int:
+        return len(self._diagnostics)
+
+    def _get_line(self, offset: int) -> int:
+        if offset >= len(self.file.text):
+            return self.file.count_lines()
+        return self.file.get_line(offset)
+
+    def write[W: TextIO](self, out: W) -> W:
+        file = self.file
+        line_count = file.count_lines()
+
+        # Resolve every span to lines once, in the order of the text
+        diagnostics = []
+        for start, end, message in sorted(self._diagnostics, key=lambda d: (d[0], d[1])):
+            start_line = self._get_line(start)
+            end_line = self._get_line(end-1) if end > start else start_line
+            diagnostics.append((start_line, end_line, start, end, message))
+
+        # Group the diagnostics into excerpts that do not overlap
+        excerpts = []
+        for diagnostic in diagnostics:
+            first_line = max(diagnostic[0] - self.lines_pre, 1)
+            last_line = min(diagnostic[1] + self.lines_post, line_count)
+            if excerpts and first_line <= excerpts[-1][1] + 1:
+                excerpt = excerpts[-1]
+                excerpt[1] = max(excerpt[1], last_line)
+                excerpt[2].append(diagnostic)
+            else:
+                excerpts.append([ first_line, last_line, [ diagnostic ] ])
+
+        if not excerpts:
+            return out
+
+        gutter_width = max(2, count_digits(max(excerpt[1] for excerpt in excerpts)))
+        gutter_start = Fore.BLACK + Back.WHITE
+        gutter_end = Style.RESET_ALL + ' '
+        empty_gutter = gutter_start + ' ' * gutter_width + gutter_end
+        underline_start = Fore.RED
+        underline_end = Style.RESET_ALL
+
+        for i, (first_line, last_line, excerpt_diagnostics) in enumerate(excerpts):
+            if i > 0:
+                out.write('\n')
+            buffer = []
+            # Diagnostics that cover the current line
+            active = []
+            k = 0
+            next_offset = file.get_line_offset(first_line)
+            for line in range(first_line, last_line+1):
+                offset = next_offset
+                next_offset = file.get_line_offset(line+1)
+                text = file[offset:next_offset]
+                if text.endswith('\n'):
+                    text = text[:-1]
+                buffer.append(f'{gutter_start}{str(line).rjust(gutter_width)}{gutter_end}{text}\n')
+                while k < len(excerpt_diagnostics) and excerpt_diagnostics[k][0] == line:
+                    active.append(excerpt_diagnostics[k])
+                    k += 1
+                if not active:
+                    continue
+                for start_line, end_line, start, end, message in active:
+                    start_column = start - offset + 1 if start_line == line else 1
+                    end_column = end - offset + 1 if end_line == line else len(text) + 1
+                    if end_column > start_column or message is not None and end_line == line:
+                        underline = '~' * (end_column - start_column)
+                        suffix = f' {message}' if message is not None and end_line == line else ''
+                        buffer.append(f'{empty_gutter}{" " * (start_column-1)}{underline_start}{underline}{underline_end}{suffix}\n')
+                active = [ diagnostic for diagnostic in active if diagnostic[1] > line ]
+            out.write(''.join(buffer))
+
+        return out
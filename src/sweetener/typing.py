@@ -1,8 +1,8 @@
 
-from functools import cmp_to_key
+from functools import cmp_to_key, lru_cache
 import types
 import typing
-from typing import Any, Callable, Generator, TypeAliasType, TypeVar, cast
+from typing import Any, Callable, Generator, NamedTuple, TypeAliasType, TypeVar, cast
 
 from sweetener.logging import warn
 from sweetener.ops import lift_key
@@ -14,9 +14,14 @@ type CoerceFn[_T] = Callable[[Any, type[_T]], _T]
 
 _class_coercions = list[tuple[type, CoerceFn]]()
 
+# Maps the class of a value and a target type to a resolved _CoercionPlan
+_coercion_plans = dict[tuple[type, Any], '_CoercionPlan']()
+
 def add_coercion(cls: type, proc: CoerceFn) -> None:
     assert(cls not in _class_coercions)
     _class_coercions.append((cls, proc))
+    # Resolved plans may now be missing the new coercion
+    _coercion_plans.clear()
 
 _Type = TypeVar('_Type', bound=type)
 
@@ -77,44 +82,49 @@ def _get_all_types(ty: Any) -> Generator[Any]:
         return
     yield ty
 
-def coerce(value: object, ty: type[_T]) -> _T:
+class _CoercionPlan:
+    """
+    The result of resolving which coercions to try for a value of a given
+    class and a given target type.
+    """
+
+    def __init__(self, identity: bool, attempts: list[tuple[Any, CoerceFn]], has_none: bool) -> None:
+        self.identity = identity
+        self.attempts = attempts
+        self.has_none = has_none
+
+def _plan_coercion(value: object, ty: Any) -> _CoercionPlan:
 
     if not typing.get_origin(ty) and isinstance(value, ty):
-        return value
+        return _CoercionPlan(True, [], False)
 
     has_none = False
-    has_non_type = False
-    types = []
+    classes = list[tuple[Any, Any]]()
 
-    for ty in _get_all_types(ty):
-        origin = typing.get_origin(ty)
-        if ty in primitive_types and isinstance(value, ty):
+    for member_ty in _get_all_types(ty):
+        origin = typing.get_origin(member_ty)
+        if member_ty in primitive_types and isinstance(value, member_ty):
             # Fast path for primitive types
-            return cast(_T, value)
-        if ty is type(None):
+            return _CoercionPlan(True, [], False)
+        if member_ty is type(None):
             has_none = True
         elif origin is None:
-            types.append(ty)
-        elif origin is not None:
-            types.append(origin)
+            classes.append((member_ty, member_ty))
         else:
-            has_non_type = True
-
-    if has_non_type:
-        raise CoercionError(f'could not coerce {value} to {ty} because {arg} contains unrecognised types') # type: ignore
+            classes.append((origin, member_ty))
 
-    if not types:
+    if not classes:
         raise CoercionError(f'could not coerce {value} to {ty} because there are no classes to coerce to')
 
-    attempts = list[tuple[Any, CoerceFn]]()
+    attempts = list[tuple[Any, Any, CoerceFn]]()
     remaining = list[Any]()
 
     # Scan all registered coercion functions for matching types
-    for cls in types:
+    for cls, member_ty in classes:
         match = False
         for cls_2, proc in _class_coercions:
             if cls is cls_2 or issubclass(cls, cls_2):
-                attempts.append((cls, proc))
+                attempts.append((cls, member_ty, proc))
                 match = True
         if not match:
             remaining.append(cls)
@@ -126,85 +136,235 @@ def coerce(value: object, ty: type[_T]) -> _T:
         if cls is not None:
             for cls_2, proc in _class_coercions:
                 if cls is cls_2 or issubclass(cls, cls_2):
-                    attempts.append((cls, proc))
+                    attempts.append((cls, ty, proc))
 
     attempts.sort(key=lift_key(cmp_to_key(make_comparator(issubclass)), 0))
 
-    for cls, proc in attempts:
+    return _CoercionPlan(False, [ (member_ty, proc) for _cls, member_ty, proc in attempts ], has_none)
+
+class CoercionCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    size: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+_coercion_cache_hits = 0
+_coercion_cache_misses = 0
+
+def coercion_cache_info() -> CoercionCacheInfo:
+    """
+    Report how often `coerce()` could reuse a previously resolved set of
+    coercions.
+    """
+    return CoercionCacheInfo(_coercion_cache_hits, _coercion_cache_misses, len(_coercion_plans))
+
+def clear_coercion_cache() -> None:
+    """
+    Forget all resolved sets of coercions and reset the counters that are
+    reported by `coercion_cache_info()`.
+    """
+    global _coercion_cache_hits, _coercion_cache_misses
+    _coercion_plans.clear()
+    _coercion_cache_hits = 0
+    _coercion_cache_misses = 0
+
+def coerce(value: object, ty: type[_T]) -> _T:
+
+    global _coercion_cache_hits, _coercion_cache_misses
+
+    key = (type(value), ty)
+    try:
+        plan = _coercion_plans.get(key)
+    except TypeError:
+        # The type expression is not hashable and can't be cached
+        plan = _plan_coercion(value, ty)
+    else:
+        if plan is None:
+            _coercion_cache_misses += 1
+            plan = _coercion_plans[key] = _plan_coercion(value, ty)
+        else:
+            _coercion_cache_hits += 1
+
+    if plan.identity:
+        return cast(_T, value)
+
+    for member_ty, proc in plan.attempts:
         try:
-            return proc(value, ty)
+            return proc(value, member_ty)
         except CoercionError:
             pass
 
     if value is None:
-        if not has_none:
+        if not plan.has_none:
             raise CoercionError(f'could not coerce None to {ty} because None is not allowed')
         return cast(_T, None)
 
     raise CoercionError(f'could not coerce {value} to {ty} because no known coercions exist for {ty}')
 
-def satisfies_type(value: _T, ty: type[_T]) -> bool:
+type TypeCheckFn = Callable[[Any], bool]
+
+TYPE_CHECK_CACHE_SIZE = 1024
+
+def _is_class(ty: Any) -> bool:
+    return typing.get_origin(ty) is None and isinstance(ty, type)
+
+def _compile_type_check(ty: Any, shallow: bool) -> TypeCheckFn:
 
     if ty is None:
-        return value is None
+        def check_none(value: Any) -> bool:
+            return value is None
+        return check_none
 
     if isinstance(ty, typing.NewType):
-        return satisfies_type(value, ty.__supertype__) # type: ignore
+        return compile_type_check(ty.__supertype__, shallow) # type: ignore
 
     if ty is typing.Any:
-        return True
+        def check_any(value: Any) -> bool:
+            return True
+        return check_any
 
     if isinstance(ty, typing.TypeAliasType):
-        return satisfies_type(value, ty.__value__)
+        # Type aliases may be recursive, so the aliased type is only compiled
+        # when the checker is first used.
+        alias = ty
+        alias_check: TypeCheckFn | None = None
+        def check_alias(value: Any) -> bool:
+            nonlocal alias_check
+            if alias_check is None:
+                alias_check = compile_type_check(alias.__value__, shallow)
+            return alias_check(value)
+        return check_alias
 
     origin = typing.get_origin(ty)
 
     if origin is None:
-        return isinstance(value, ty)
+        cls = ty
+        def check_class(value: Any) -> bool:
+            return isinstance(value, cls)
+        return check_class
 
     args = typing.get_args(ty)
 
     if origin is typing.Union or origin == types.UnionType:
-        return any(satisfies_type(value, arg) for arg in args)
-
-    if origin is dict:
-        if not isinstance(value, dict):
+        if all(_is_class(arg) for arg in args):
+            classes = tuple(args)
+            def check_classes(value: Any) -> bool:
+                return isinstance(value, classes)
+            return check_classes
+        arg_checks = tuple(compile_type_check(arg, shallow) for arg in args)
+        def check_union(value: Any) -> bool:
+            for check in arg_checks:
+                if check(value):
+                    return True
             return False
-        key_type = args[0]
-        value_type = args[1]
-        for k, v in value.items():
-            if not satisfies_type(k, key_type) or not satisfies_type(v, value_type):
-                return False
-        return True
+        return check_union
 
-    if origin is set:
-        element_type = args[0]
-        return isinstance(value, set) \
-            and all(satisfies_type(v, element_type) for v in value)
+    if shallow and (origin is dict or origin is set or origin is list):
+        container = origin
+        def check_container_only(value: Any) -> bool:
+            return isinstance(value, container)
+        return check_container_only
 
-    if origin is list:
+    if origin is dict:
+        key_check = compile_type_check(args[0])
+        value_check = compile_type_check(args[1])
+        def check_dict(value: Any) -> bool:
+            if not isinstance(value, dict):
+                return False
+            for k, v in value.items():
+                if not key_check(k) or not value_check(v):
+                    return False
+            return True
+        return check_dict
+
+    if origin is set or origin is list:
+        container = origin
         element_type = args[0]
-        return isinstance(value, list) \
-            and all(satisfies_type(v, element_type) for v in value)
+        if element_type is typing.Any:
+            def check_container(value: Any) -> bool:
+                return isinstance(value, container)
+            return check_container
+        if _is_class(element_type):
+            element_cls = element_type
+            def check_class_elements(value: Any) -> bool:
+                if not isinstance(value, container):
+                    return False
+                for element in value:
+                    if not isinstance(element, element_cls):
+                        return False
+                return True
+            return check_class_elements
+        element_check = compile_type_check(element_type)
+        def check_elements(value: Any) -> bool:
+            if not isinstance(value, container):
+                return False
+            for element in value:
+                if not element_check(element):
+                    return False
+            return True
+        return check_elements
 
     if origin is Callable:
         # TODO check whether the parameter types are satisfied
-        return callable(value)
+        def check_callable(value: Any) -> bool:
+            return callable(value)
+        return check_callable
 
     if origin is tuple:
-        if not isinstance(value, tuple) or len(value) != len(args):
-            return False
-        i = 0
-        for element in value:
-            element_type = args[i]
-            if element_type == Ellipsis:
-                element_type = args[i-1]
-            else:
-                i += 1
-            if not satisfies_type(element, element_type):
+        if shallow:
+            # Fixed-size tuples are still checked for their length
+            size = None if len(args) == 2 and args[1] is Ellipsis else len(args)
+            def check_tuple_only(value: Any) -> bool:
+                return isinstance(value, tuple) and (size is None or len(value) == size)
+            return check_tuple_only
+        if len(args) == 2 and args[1] is Ellipsis:
+            rest_check = compile_type_check(args[0])
+            def check_variadic_tuple(value: Any) -> bool:
+                if not isinstance(value, tuple):
+                    return False
+                for element in value:
+                    if not rest_check(element):
+                        return False
+                return True
+            return check_variadic_tuple
+        element_checks = tuple(compile_type_check(arg) for arg in args)
+        def check_tuple(value: Any) -> bool:
+            if not isinstance(value, tuple) or len(value) != len(element_checks):
                 return False
-        return True
+            for check, element in zip(element_checks, value):
+                if not check(element):
+                    return False
+            return True
+        return check_tuple
 
     warn(f'no type-checking logic defined for {origin}')
-    return isinstance(value, origin)
+    def check_origin(value: Any) -> bool:
+        return isinstance(value, origin)
+    return check_origin
+
+_compile_type_check_cached = lru_cache(maxsize=TYPE_CHECK_CACHE_SIZE)(_compile_type_check)
+
+def compile_type_check(ty: Any, shallow: bool = False) -> TypeCheckFn:
+    """
+    Turn a type expression into a function that checks whether a value
+    satisfies that type.
+
+    If `shallow` is set, the elements of lists, sets, dictionaries and
+    tuples are not checked, making the check independent of the size of the
+    value.
+
+    Checkers are cached per type expression, so compiling the same type
+    twice is cheap.
+    """
+    try:
+        return _compile_type_check_cached(ty, shallow)
+    except TypeError:
+        # The type expression is not hashable and therefore can't be cached
+        return _compile_type_check(ty, shallow)
 
+def satisfies_type(value: _T, ty: type[_T]) -> bool:
+    return compile_type_check(ty)(value)
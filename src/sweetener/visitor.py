@@ -0,0 +1,103 @@
+
+from typing import Any, Callable, TypeVar
+
+from .node import expand_nodes
+from .record import Record, transform
+from .util import is_primitive
+
+_T = TypeVar('_T')
+
+type _Method = Callable[[Any, Any], Any]
+
+class _Dispatcher:
+    """
+    Finds the method that handles a given record class.
+
+    A method named `<prefix><ClassName>` handles instances of that class and
+    of all its subclasses, unless a subclass has a method of its own. The
+    lookup through the MRO happens once per record class and is then cached
+    on the visitor class.
+    """
+
+    _method_cache: dict[tuple[str, type], _Method | None] = {}
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._method_cache = {}
+
+    @classmethod
+    def _get_method(cls, prefix: str, record_cls: type) -> _Method | None:
+        key = (prefix, record_cls)
+        try:
+            return cls._method_cache[key]
+        except KeyError:
+            pass
+        method = None
+        for pcls in record_cls.__mro__:
+            method = getattr(cls, prefix + pcls.__name__, None)
+            if method is not None:
+                break
+        cls._method_cache[key] = method
+        return method
+
+class Visitor(_Dispatcher):
+    """
+    Base class for passes that inspect a tree of records.
+
+    Define `visit_Add(self, node)` to handle `Add` records before their
+    children are visited and `leave_Add(self, node)` to handle them
+    afterwards. If a `visit_` method returns `False`, the children of that
+    record are skipped. Methods for base classes such as `visit_Expr` or
+    `visit_Record` handle every subclass that has no method of its own.
+    """
+
+    def visit(self, root: Any) -> None:
+        cls = type(self)
+        stack: list[tuple[bool, Any]] = [ (False, root) ]
+        while stack:
+            leaving, value = stack.pop()
+            if leaving:
+                method = cls._get_method('leave_', type(value))
+                assert(method is not None)
+                method(self, value)
+                continue
+            if isinstance(value, Record):
+                method = cls._get_method('visit_', type(value))
+                if method is not None and method(self, value) is False:
+                    continue
+                if cls._get_method('leave_', type(value)) is not None:
+                    stack.append((True, value))
+            children = [ child for _key, child in expand_nodes(value) if not is_primitive(child) ]
+            for child in reversed(children):
+                stack.append((False, child))
+
+class Transformer(_Dispatcher):
+    """
+    Base class for passes that rewrite a tree of records.
+
+    `visit_Add(self, node)` is called before the children of an `Add` record
+    are transformed. Returning a different value replaces the record and its
+    children as a whole; returning `node` itself continues into the children.
+    `leave_Add(self, node)` is called after the children were transformed and
+    returns the replacement of the (possibly rebuilt) record.
+
+    Records and containers are only rebuilt when something inside them
+    changed, so unchanged subtrees are shared with the input tree. A method
+    signals that nothing changed by returning the very same object, because
+    values are compared by identity. See `transform()` for the details.
+    """
+
+    def _enter(self, value: Any) -> Any:
+        if not isinstance(value, Record):
+            return value
+        method = type(self)._get_method('visit_', type(value))
+        return value if method is None else method(self, value)
+
+    def _leave(self, value: Any) -> Any:
+        if not isinstance(value, Record):
+            return value
+        method = type(self)._get_method('leave_', type(value))
+        return value if method is None else method(self, value)
+
+    def transform(self, root: _T) -> _T:
+        return transform(root, self._enter, self._leave, identity=True)